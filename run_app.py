@@ -16,6 +16,28 @@ if __name__ == "__main__":
     parser.add_argument("--chunk", type=int, default=300)
     parser.add_argument("--modelo", default="all-MiniLM-L6-v2")
     parser.add_argument("--api_key", default=None, help="OPENAI API KEY (si no está en env)")
+    parser.add_argument("--nlist", type=int, default=None, help="Particiones del índice IVF (sin valor: búsqueda exacta)")
+    parser.add_argument("--nprobe", type=int, default=8, help="Particiones IVF visitadas por consulta")
+    parser.add_argument("--hnsw_m", type=int, default=None, help="Vecinos por nodo del índice HNSW (sin valor: no se usa)")
+    parser.add_argument("--ef_search", type=int, default=64, help="Candidatos explorados por consulta en el HNSW")
+    parser.add_argument("--pq_m", type=int, default=None, help="Bytes por vector con cuantización por producto (sin valor: sin comprimir)")
+    parser.add_argument("--int8", action="store_true", help="Comprimir los vectores con cuantización escalar int8")
+    parser.add_argument("--reordenar", type=int, default=None, help="Factor de candidatos re-puntuados con los vectores originales (sin valor: 4 con --int8, 0 con --pq_m)")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"], help="Tipo de almacenamiento de los vectores")
+    parser.add_argument("--hilos", type=int, default=1, help="Hilos para la búsqueda por fuerza bruta")
+    parser.add_argument("--deduplicar", action="store_true", help="Guardar una sola vez los chunks duplicados o casi duplicados")
+    parser.add_argument("--hibrido", action="store_true", help="Combinar la búsqueda por vectores con una búsqueda léxica BM25")
+    parser.add_argument("--mmr", type=float, default=None, help="Lambda del MMR para diversificar los resultados (1 = solo relevancia; sin valor: no se usa)")
+    parser.add_argument("--cache", type=int, default=256, help="Búsquedas guardadas en la caché de consultas (0 = sin caché)")
+    parser.add_argument("--cache_ttl", type=float, default=None, help="Segundos de validez de cada búsqueda en caché (sin valor: no caducan)")
+    parser.add_argument("--top_documentos", type=int, default=None, help="Búsqueda en dos fases: documentos preseleccionados por su centroide (sin valor: se recorren todos los chunks)")
+    parser.add_argument("--expandir", type=int, default=0, help="Chunks vecinos que se añaden a cada lado de cada fragmento encontrado")
+    parser.add_argument("--recall", type=int, default=0, help="Consultas de muestra para el informe de recall@k")
+    parser.add_argument("--publicar", default=None, help="Publicar el índice en memoria compartida con este nombre")
+    parser.add_argument("--adjuntar", default=None, help="Usar el índice publicado con este nombre en lugar de construirlo")
+    parser.add_argument("--instantaneas", default=None, help="Directorio de instantáneas versionadas del índice (con CURRENT)")
+    parser.add_argument("--servir", action="store_true", help="Usar la instantánea actual de --instantaneas y recargar las nuevas en caliente")
+    parser.add_argument("--solo_construir", action="store_true", help="Construir el índice, publicarlo en --instantaneas y salir")
     
     args = parser.parse_args()
     
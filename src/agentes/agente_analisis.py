@@ -1,26 +1,370 @@
 # src/agentes/agente_analisis.py
-from typing import List
+import copy
+import time
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 from src.core.embeddings import EmbeddingModel
 from src.core.vector_store import VectorStore
+from src.core.cuantizacion import CuantizadorEscalar
+from src.core.evaluacion import comparar_busquedas, muestrear_consultas
+from src.core.duplicados import colapsar_duplicados
+from src.core.cache import CacheLRU, normalizar_consulta
+from src.core.instantaneas import VigilanteInstantaneas, publicar_instantanea
+
+def textos_chunks(chunks_meta: List[dict], textos: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Texto de cada chunk: el suyo propio o, si viene como span, el trozo
+    [inicio, fin) del texto de su documento.
+    """
+    return [c["texto"] if "texto" in c else textos[c["documento"]][c["inicio"]:c["fin"]]
+            for c in chunks_meta]
 
 class AgenteAnalisis:
     """
     Genera embeddings y administra el VectorStore.
     """
-    def __init__(self, modelo_name: str = "all-MiniLM-L6-v2"):
+    # Consultas de muestra y top_k máximo de la referencia exacta en float32 que
+    # se guarda al indexar si el almacén es float16 o descarta los originales
+    MUESTRA_RECALL = 256
+    TOP_K_RECALL = 32
+
+    def __init__(self, modelo_name: str = "all-MiniLM-L6-v2", nlist: Optional[int] = None, nprobe: int = 8,
+                 hnsw_m: Optional[int] = None, ef_construccion: int = 200, ef_busqueda: int = 64,
+                 pq_m: Optional[int] = None, int8: bool = False, reordenar: Optional[int] = None,
+                 dtype: str = "float32", hilos: int = 1, deduplicar: bool = False,
+                 hibrido: bool = False, lambda_mmr: Optional[float] = None,
+                 cache: int = 256, cache_ttl: Optional[float] = None,
+                 top_documentos: Optional[int] = None):
+        """
+        nlist: si se indica, se construye un índice IVF aproximado con ese número de particiones
+        nprobe: particiones del IVF que se visitan por consulta
+        hnsw_m: si se indica, se construye un grafo HNSW con ese número de vecinos por nodo
+        ef_construccion / ef_busqueda: candidatos explorados por el HNSW al insertar / buscar
+        pq_m: si se indica, los vectores se comprimen con cuantización por producto (m bytes por vector);
+            con nlist, las particiones visitadas se puntúan con los códigos (IVF-PQ). No admite hnsw_m
+        int8: comprime los vectores con cuantización escalar int8 (si no se usa pq_m)
+        reordenar: factor de candidatos que se re-puntúan con los vectores originales (0 = no se
+            conservan; por defecto, CuantizadorEscalar.REORDENAR con int8 y 0 con pq_m)
+        dtype: tipo de almacenamiento de los vectores ("float32" o "float16", la mitad de memoria)
+        hilos: hilos con los que se reparte la búsqueda por fuerza bruta
+        deduplicar: guarda una sola vez los chunks duplicados o casi duplicados (con sus 'fuentes')
+        hibrido: construye también un índice léxico BM25 y fusiona sus resultados con los de los vectores
+        lambda_mmr: si se indica, los resultados se diversifican con MMR (1 = solo relevancia, 0 = solo diversidad)
+        cache / cache_ttl: entradas y segundos de vida de la caché de búsquedas (cache=0 la desactiva)
+        top_documentos: si se indica, se guardan centroides por documento y cada búsqueda
+            recorre solo los chunks de los top_documentos documentos más parecidos
+        """
+        if hnsw_m and (pq_m or int8):
+            raise ValueError("La compresión (pq_m/int8) no se puede combinar con HNSW; usa nlist (IVF-PQ)")
         self.embedder = EmbeddingModel(modelo_name)
         self.store = None
+        self._generacion = 0  # Sube con cada almacén nuevo (la versión de uno cargado empieza en 0)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construccion = ef_construccion
+        self.ef_busqueda = ef_busqueda
+        self.pq_m = pq_m
+        self.int8 = int8
+        if reordenar is None:
+            reordenar = CuantizadorEscalar.REORDENAR if int8 and not pq_m else 0
+        self.reordenar = reordenar
+        self.dtype = dtype
+        self.hilos = hilos
+        self.deduplicar = deduplicar
+        self.duplicados = 0  # Chunks colapsados en la última indexación
+        self.hibrido = hibrido
+        self.lambda_mmr = lambda_mmr
+        self.cache = CacheLRU(cache, cache_ttl) if cache else None
+        self.vigilante: Optional[VigilanteInstantaneas] = None
+        self.top_documentos = top_documentos
+        self._referencia = None  # Búsqueda exacta (float32) de muestra para informe_recall
 
-    def indexar_chunks(self, chunks_meta: List[dict]):
-        textos = [c["texto"] for c in chunks_meta]
-        embs = self.embedder.embedir(textos)  # np.ndarray
+    def indexar_chunks(self, chunks_meta: List[dict], textos: Optional[Dict[str, str]] = None):
+        """
+        textos: texto de cada documento, si los chunks vienen como spans (AgenteExtraccion.textos)
+        """
+        chunks_meta, textos_c = self._sin_duplicados(chunks_meta, textos)
+        embs = self.embedder.embedir(textos_c)  # np.ndarray
         dim = embs.shape[1]
-        self.store = VectorStore(dim)
-        self.store.agregar(embs, chunks_meta)
+        self._usar_store(VectorStore(dim, dtype=self.dtype, hilos=self.hilos))
+        self.store.agregar(embs, chunks_meta, textos)
+        conservar = bool(self.reordenar)  # Con IVF se puntúan los códigos de las particiones (IVF-PQ)
+        self._referencia = None
+        if self.dtype != "float32" or ((self.pq_m or self.int8) and not conservar):
+            # El almacén no podrá hacer la búsqueda exacta en float32: se hace ahora
+            self._referencia = self._referencia_exacta(embs)
+        if self.hibrido:
+            self.store.construir_bm25()
+        if self.top_documentos:
+            self.store.construir_centroides()
+        if self.hnsw_m:
+            self.store.construir_hnsw(self.hnsw_m, self.ef_construccion, self.ef_busqueda)
+        elif self.nlist:
+            # No puede haber más particiones que vectores
+            self.store.construir_ivf(min(self.nlist, len(self.store)), self.nprobe)
+        if self.pq_m:
+            self.store.comprimir_pq(self.pq_m, self.reordenar, conservar_originales=conservar)
+        elif self.int8:
+            self.store.comprimir_int8(self.reordenar, conservar_originales=conservar)
+        if self._referencia is not None:
+            self._referencia["version"] = self.store.version
         return self.store
 
-    def buscar_similares(self, consulta: str, top_k: int = 3):
-        consulta_emb = self.embedder.embedir([consulta])[0]
-        resultados = self.store.buscar(consulta_emb, top_k)
+    def _referencia_exacta(self, embs: np.ndarray) -> dict:
+        """
+        Top-TOP_K_RECALL exacto, con los embeddings float32, de MUESTRA_RECALL
+        vectores del corpus y su latencia (referencia de informe_recall).
+        """
+        store = self.store
+        if store.dtype != np.float32:
+            store = VectorStore(embs.shape[1], hilos=self.hilos)
+            store.agregar(embs, [{} for _ in range(len(embs))])
+        consultas = muestrear_consultas(embs, self.MUESTRA_RECALL)
+        inicio = time.perf_counter()
+        exactos = store.buscar_filas(consultas, self.TOP_K_RECALL, exacto=True)
+        ms = 1000 * (time.perf_counter() - inicio) / max(len(consultas), 1)
+        return {"consultas": consultas, "exactos": exactos, "ms_exacto": ms}
+
+    def _sin_duplicados(self, chunks_meta: List[dict], textos: Optional[Dict[str, str]]):
+        """
+        Textos de los chunks y, si deduplicar está activo, los chunks sin
+        duplicados: así no se calculan ni guardan embeddings repetidos.
+        """
+        textos_c = textos_chunks(chunks_meta, textos)
+        self.duplicados = 0
+        if self.deduplicar:
+            unicos, posiciones = colapsar_duplicados(chunks_meta, textos_c)
+            self.duplicados = len(chunks_meta) - len(unicos)
+            chunks_meta, textos_c = unicos, [textos_c[p] for p in posiciones]
+        return chunks_meta, textos_c
+
+    def actualizar_documento(self, nombre: str, chunks_meta: List[dict],
+                             textos: Optional[Dict[str, str]] = None):
+        """
+        Reemplaza en el índice los chunks de un documento que ha cambiado
+        (o lo elimina si chunks_meta está vacío) sin reindexar el resto.
+        Con deduplicar, los duplicados se colapsan dentro del documento.
+        """
+        if not chunks_meta:
+            self.store.eliminar_documento(nombre)
+            return self.store
+        chunks_meta, textos_c = self._sin_duplicados(chunks_meta, textos)
+        embs = self.embedder.embedir(textos_c)
+        self.store.reemplazar_documento(nombre, embs, chunks_meta, textos)
+        return self.store
+
+    def publicar_indice(self, nombre: Optional[str] = None) -> str:
+        """
+        Publica el índice en memoria compartida para que otros procesos del
+        equipo lo usen con adjuntar_indice() sin cargar su propia copia.
+        Devuelve el nombre del bloque.
+        """
+        return self.store.publicar(nombre)
+
+    def adjuntar_indice(self, nombre: str):
+        """
+        Usa (en solo lectura y sin copiarlo) el índice publicado por otro proceso.
+        """
+        self._usar_store(VectorStore.adjuntar(nombre, hilos=self.hilos))
+        return self.store
+
+    def _usar_store(self, store: VectorStore):
+        self.store = store
+        self._generacion += 1  # Después del cambio de almacén: ver buscar_similares
+        self._limpiar_cache()
+
+    def _limpiar_cache(self):
+        if self.cache is not None:
+            self.cache.limpiar()
+
+    def publicar_instantanea(self, raiz: str, conservar: int = 3) -> str:
+        """
+        Guarda el índice como instantánea nueva de 'raiz' y apunta CURRENT a
+        ella; los procesos que la vigilan (vigilar_instantaneas) la cargan solos.
+        """
+        return publicar_instantanea(self.store, raiz, conservar)
+
+    def vigilar_instantaneas(self, raiz: str, intervalo: float = 2.0):
+        """
+        Carga la instantánea actual de 'raiz' y, en segundo plano, cambia a
+        cada instantánea nueva que se publique sin detener las búsquedas: las
+        que estén en curso terminan con el almacén anterior.
+        """
+        if self.vigilante is not None:
+            self.vigilante.detener()
+        self.vigilante = VigilanteInstantaneas(raiz, self._cambiar_store, intervalo)
+        self.vigilante.comprobar()
+        self.vigilante.iniciar()
+        return self.store
+
+    def _cambiar_store(self, store: VectorStore):
+        store.hilos = self.hilos
+        self._usar_store(store)
+
+    def buscar_similares(self, consulta: str, top_k: int = 3, documentos: Optional[List[str]] = None,
+                         expandir: int = 0):
+        """
+        documentos: si se indica, solo se buscan fragmentos de esos documentos
+        expandir: añade a cada fragmento sus 'expandir' chunks vecinos a cada lado,
+            unidos sin repetir el solapamiento (ver VectorStore.expandir)
+
+        Las respuestas se guardan en la caché con la pregunta normalizada, los
+        parámetros de la búsqueda, la generación del almacén (cada almacén
+        construido, adjuntado o recargado tiene una nueva) y su versión:
+        cualquier cambio en el índice deja de coincidir con las entradas anteriores.
+        """
+        # La generación se lee antes que el almacén: si se cambia entre medias,
+        # el resultado se guarda con la generación anterior y no se reutiliza
+        generacion = self._generacion
+        store = self.store  # La búsqueda entera usa el mismo almacén aunque se recargue
+        if self.cache is None:
+            return self._buscar_similares(store, consulta, top_k, documentos, expandir)
+        clave = self._clave(consulta, top_k, documentos, expandir, generacion, store)
+        # La caché guarda y entrega copias profundas: quien llama puede modificar
+        # los resultados, incluidas sus listas anidadas (fuentes, chunks_contexto)
+        resultados = self.cache.obtener(clave)
+        if resultados is None:
+            resultados = self._buscar_similares(store, consulta, top_k, documentos, expandir)
+            self.cache.guardar(clave, copy.deepcopy(resultados))
+            return resultados
+        return copy.deepcopy(resultados)
+
+    def _clave(self, consulta: str, top_k: int, documentos: Optional[List[str]], expandir: int,
+               generacion: int, store: VectorStore) -> tuple:
+        """Clave de caché de una búsqueda (ver buscar_similares)."""
+        return (normalizar_consulta(consulta), top_k, tuple(sorted(documentos)) if documentos else None,
+                expandir, self.hibrido, self.lambda_mmr, self.top_documentos, generacion, store.version)
+
+    def _buscar_similares(self, store: VectorStore, consulta: str, top_k: int,
+                          documentos: Optional[List[str]], expandir: int = 0,
+                          consulta_emb: Optional[np.ndarray] = None):
+        resultados = self._buscar(store, consulta, top_k, documentos, consulta_emb)
+        return self._expandir(store, resultados, expandir)
+
+    def _expandir(self, store: VectorStore, resultados: List[dict], expandir: int) -> List[dict]:
+        if expandir and not store.solo_lectura:
+            return store.expandir(resultados, expandir)
         return resultados
+
+    def _buscar(self, store: VectorStore, consulta: str, top_k: int, documentos: Optional[List[str]],
+                consulta_emb: Optional[np.ndarray] = None):
+        if consulta_emb is None:
+            consulta_emb = self.embedder.embedir([consulta])[0]
+        opciones = self._opciones(store)
+        opciones["filtro"] = {"documento": documentos} if documentos else None
+        if self.lambda_mmr is not None:
+            return store.buscar_diverso(consulta_emb, top_k, self.lambda_mmr,
+                                        consulta=consulta if self.hibrido else None, **opciones)
+        if self.hibrido and store.bm25 is not None:
+            return store.buscar_hibrido(consulta_emb, consulta, top_k, **opciones)
+        resultados = store.buscar(consulta_emb, top_k, **opciones)
+        return resultados
+
+    def _opciones(self, store: VectorStore) -> dict:
+        """Opciones de búsqueda configuradas que el almacén puede atender."""
+        if self.top_documentos and store.centroides is not None:
+            return {"top_documentos": self.top_documentos}
+        return {}
+
+    def buscar_similares_lote(self, consultas: List[str], top_k: int = 3, documentos: Optional[List[str]] = None,
+                              expandir: int = 0) -> List[List[dict]]:
+        """
+        Igual que buscar_similares (mismas opciones y misma caché) pero para
+        muchas preguntas: las que no están en la caché se codifican en una sola
+        llamada al modelo y, si la búsqueda es solo por vectores, se puntúan con
+        un único producto de matrices. Con búsqueda híbrida o diversa cada
+        pregunta se resuelve por separado con su vector ya calculado.
+        """
+        if not consultas:
+            return []
+        generacion = self._generacion  # Mismo orden que en buscar_similares
+        store = self.store
+        claves = [self._clave(c, top_k, documentos, expandir, generacion, store) for c in consultas] \
+            if self.cache is not None else [None] * len(consultas)
+        resultados = [copy.deepcopy(self.cache.obtener(clave)) if clave is not None else None for clave in claves]
+        pendientes = [i for i, r in enumerate(resultados) if r is None]
+        if not pendientes:
+            return resultados
+
+        consultas_emb = self.embedder.embedir([consultas[i] for i in pendientes])
+        if self.lambda_mmr is None and not (self.hibrido and store.bm25 is not None):
+            opciones = self._opciones(store)
+            opciones["filtro"] = {"documento": documentos} if documentos else None
+            nuevos = store.buscar_lote(consultas_emb, top_k, **opciones)
+        else:
+            nuevos = [self._buscar(store, consultas[i], top_k, documentos, emb)
+                      for i, emb in zip(pendientes, consultas_emb)]
+        for i, nuevo in zip(pendientes, nuevos):
+            resultados[i] = self._expandir(store, nuevo, expandir)
+            if claves[i] is not None:
+                self.cache.guardar(claves[i], copy.deepcopy(resultados[i]))
+        return resultados
+
+    def informe_recall(self, consultas: Optional[List[str]] = None, n_consultas: int = 100,
+                       top_k: int = 4) -> Dict[str, float]:
+        """
+        Compara la búsqueda configurada (IVF, HNSW, comprimida o en dos fases)
+        con la búsqueda exacta. Si no se dan consultas, usa n_consultas
+        vectores del propio corpus.
+
+        Si el almacén es float16 o al comprimir se descartaron los vectores
+        originales, la búsqueda exacta en float32 ya no es posible: se usa la
+        referencia calculada al indexar (hasta MUESTRA_RECALL consultas del
+        corpus y top_k <= TOP_K_RECALL), así que el recall incluye también la
+        pérdida del float16. Con consultas propias o tras cambiar el índice se
+        recurre a la búsqueda exacta del propio almacén.
+
+        Raises:
+            ValueError: Si no hay vectores originales ni una referencia exacta válida
+        """
+        store = self.store
+        opciones = self._opciones(store)
+        return self._comparar_con_exacta(store, lambda q, k: store.buscar_filas(q, k, **opciones),
+                                         consultas, n_consultas, top_k)
+
+    def informe_documentos(self, valores: Tuple[int, ...] = (1, 2, 4, 8, 16),
+                           consultas: Optional[List[str]] = None, n_consultas: int = 100,
+                           top_k: int = 4) -> List[Dict[str, float]]:
+        """
+        Compromiso latencia/recall de la búsqueda en dos fases: un informe de
+        comparar_busquedas (frente al recorrido exacto de todo el corpus) por
+        cada número de documentos preseleccionados en 'valores'.
+
+        Raises:
+            ValueError: Si el índice no tiene centroides (se indexó sin top_documentos)
+        """
+        store = self.store
+        if store.centroides is None:
+            raise ValueError("El índice no tiene centroides de documentos; indéxalo con top_documentos")
+        informes = []
+        for d in valores:
+            informe = self._comparar_con_exacta(
+                store, lambda q, k: store.buscar_filas(q, k, top_documentos=d),
+                consultas, n_consultas, top_k)
+            informe["top_documentos"] = d
+            informes.append(informe)
+        return informes
+
+    def _comparar_con_exacta(self, store: VectorStore, buscar, consultas: Optional[List[str]],
+                             n_consultas: int, top_k: int) -> Dict[str, float]:
+        referencia = self._referencia
+        if (consultas or referencia is None or referencia["version"] != store.version
+                or top_k > self.TOP_K_RECALL):
+            if store.originales:
+                return comparar_busquedas(lambda q, k: store.buscar_filas(q, k, exacto=True), buscar,
+                                          self._consultas_informe(store, consultas, n_consultas), top_k)
+            raise ValueError(
+                "El índice comprimido no conserva los vectores originales: el recall solo se puede "
+                f"medir con las consultas de muestra tomadas al indexarlo (top_k <= {self.TOP_K_RECALL}) "
+                "y sin cambios posteriores; usa reordenar para conservarlos")
+        n = min(n_consultas, len(referencia["consultas"]))
+        informe = comparar_busquedas(lambda q, k: [(f[:k], p[:k]) for f, p in referencia["exactos"][:n]],
+                                     buscar, referencia["consultas"][:n], top_k)
+        informe["ms_exacto"] = referencia["ms_exacto"]
+        return informe
+
+    def _consultas_informe(self, store: VectorStore, consultas: Optional[List[str]], n_consultas: int):
+        if consultas:
+            return self.embedder.embedir(consultas)
+        return muestrear_consultas(store.embeddings, n_consultas)
@@ -5,7 +5,7 @@ from PyPDF2 import PdfReader
 from PIL import Image
 import pytesseract
 
-from src.core.chunking import crear_chunks
+from src.core.chunking import crear_spans
 
 class AgenteExtraccion:
     """
@@ -14,6 +14,7 @@ class AgenteExtraccion:
     """
     def __init__(self, carpeta: str):
         self.carpeta = carpeta
+        self.textos: Dict[str, str] = {}  # documento -> texto normalizado al que apuntan sus chunks
 
     def extraer_texto_archivo(self, ruta: str) -> str:
         ruta = os.path.abspath(ruta)
@@ -36,22 +37,33 @@ class AgenteExtraccion:
     def procesar(self, tam_chunk:int = 300) -> List[Dict]:
         """
         Devuelve lista de dicts:
-        { "documento": nombre, "chunk_id": i, "texto": chunk_text }
+        { "documento": nombre, "chunk_id": i, "inicio": c0, "fin": c1 }
+        donde [inicio, fin) es la posición del chunk (en caracteres) dentro de
+        self.textos[nombre]; el texto del chunk no se copia.
         """
         archivos = sorted(os.listdir(self.carpeta))
         todos_chunks = []
         for archivo in archivos:
-            ruta = os.path.join(self.carpeta, archivo)
-            if not os.path.isfile(ruta):
-                continue
-            texto = self.extraer_texto_archivo(ruta)
-            if not texto or len(texto.strip()) == 0:
-                continue
-            chunks = crear_chunks(texto, tam= tam_chunk)
-            for idx, ch in enumerate(chunks):
-                todos_chunks.append({
-                    "documento": archivo,
-                    "chunk_id": idx,
-                    "texto": ch
-                })
+            todos_chunks.extend(self.procesar_archivo(archivo, tam_chunk))
         return todos_chunks
+
+    def procesar_archivo(self, archivo: str, tam_chunk: int = 300) -> List[Dict]:
+        """
+        Chunks de un solo archivo de la carpeta (mismo formato que procesar).
+        Sirve para reindexar únicamente un archivo que ha cambiado.
+        """
+        ruta = os.path.join(self.carpeta, archivo)
+        if not os.path.isfile(ruta):
+            return []
+        texto = self.extraer_texto_archivo(ruta)
+        if not texto or len(texto.strip()) == 0:
+            return []
+        texto, spans = crear_spans(texto, tam= tam_chunk)
+        self.textos[archivo] = texto
+        return [{
+            "documento": archivo,
+            "chunk_id": idx,
+            "inicio": inicio,
+            "fin": fin
+        } for idx, (inicio, fin) in enumerate(spans)]
+
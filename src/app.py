@@ -4,27 +4,40 @@ import argparse
 from src.agentes.agente_extraccion import AgenteExtraccion
 from src.agentes.agente_analisis import AgenteAnalisis
 from src.agentes.agente_respuesta import AgenteRespuesta
+from src.core.evaluacion import formatear_informe
 
-def construir_indice(data_dir: str, tam_chunk: int = 300, modelo: str = "all-MiniLM-L6-v2"):
+def construir_indice(data_dir: str, tam_chunk: int = 300, modelo: str = "all-MiniLM-L6-v2",
+                     nlist: int = None, nprobe: int = 8, hnsw_m: int = None, ef_busqueda: int = 64,
+                     pq_m: int = None, int8: bool = False, reordenar: int = None, dtype: str = "float32",
+                     hilos: int = 1, deduplicar: bool = False, hibrido: bool = False,
+                     lambda_mmr: float = None, cache: int = 256, cache_ttl: float = None,
+                     top_documentos: int = None):
     extractor = AgenteExtraccion(data_dir)
     print("[*] Extrayendo y creando chunks...")
     chunks_meta = extractor.procesar(tam_chunk)
     print(f"[*] Chunks creados: {len(chunks_meta)}")
 
-    analisis = AgenteAnalisis(modelo_name=modelo)
+    analisis = AgenteAnalisis(modelo_name=modelo, nlist=nlist, nprobe=nprobe,
+                              hnsw_m=hnsw_m, ef_busqueda=ef_busqueda,
+                              pq_m=pq_m, int8=int8, reordenar=reordenar, dtype=dtype,
+                              hilos=hilos, deduplicar=deduplicar, hibrido=hibrido,
+                              lambda_mmr=lambda_mmr, cache=cache, cache_ttl=cache_ttl,
+                              top_documentos=top_documentos)
     print("[*] Generando embeddings e indexando...")
-    store = analisis.indexar_chunks(chunks_meta)
+    store = analisis.indexar_chunks(chunks_meta, extractor.textos)
+    if deduplicar:
+        print(f"[*] Chunks duplicados colapsados: {analisis.duplicados}")
     print("[*] Index creado.")
     return analisis
 
-def modo_interactivo(analisis: AgenteAnalisis, api_key: str):
+def modo_interactivo(analisis: AgenteAnalisis, api_key: str, expandir: int = 0):
     respuesta_agent = AgenteRespuesta(api_key)
     print("\nModo interactivo. Escribe 'salir' para terminar.\n")
     while True:
         pregunta = input("Pregunta > ").strip()
         if pregunta.lower() in ["salir", "exit", "quit"]:
             break
-        fragmentos = analisis.buscar_similares(pregunta, top_k=4)
+        fragmentos = analisis.buscar_similares(pregunta, top_k=4, expandir=expandir)
         if not fragmentos:
             print("No hay fragmentos indexados.")
             continue
@@ -32,6 +45,10 @@ def modo_interactivo(analisis: AgenteAnalisis, api_key: str):
         print("\n--- RESPUESTA ---")
         print(out)
         print("-----------------\n")
+    if analisis.cache is not None:
+        e = analisis.cache.estadisticas()
+        print(f"[*] Caché de búsquedas: {e['aciertos']} aciertos, {e['fallos']} fallos "
+              f"({e['tasa_aciertos']:.0%}), {e['entradas']} entradas")
 
 def main():
     parser = argparse.ArgumentParser()
@@ -39,10 +56,83 @@ def main():
     parser.add_argument("--chunk", type=int, default=300)
     parser.add_argument("--modelo", default="all-MiniLM-L6-v2")
     parser.add_argument("--api_key", default=None, help="OPENAI API KEY (si no está en env)")
+    parser.add_argument("--nlist", type=int, default=None, help="Particiones del índice IVF (sin valor: búsqueda exacta)")
+    parser.add_argument("--nprobe", type=int, default=8, help="Particiones IVF visitadas por consulta")
+    parser.add_argument("--hnsw_m", type=int, default=None, help="Vecinos por nodo del índice HNSW (sin valor: no se usa)")
+    parser.add_argument("--ef_search", type=int, default=64, help="Candidatos explorados por consulta en el HNSW")
+    parser.add_argument("--pq_m", type=int, default=None, help="Bytes por vector con cuantización por producto (sin valor: sin comprimir)")
+    parser.add_argument("--int8", action="store_true", help="Comprimir los vectores con cuantización escalar int8")
+    parser.add_argument("--reordenar", type=int, default=None, help="Factor de candidatos re-puntuados con los vectores originales (sin valor: 4 con --int8, 0 con --pq_m)")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"], help="Tipo de almacenamiento de los vectores")
+    parser.add_argument("--hilos", type=int, default=1, help="Hilos para la búsqueda por fuerza bruta")
+    parser.add_argument("--deduplicar", action="store_true", help="Guardar una sola vez los chunks duplicados o casi duplicados")
+    parser.add_argument("--hibrido", action="store_true", help="Combinar la búsqueda por vectores con una búsqueda léxica BM25")
+    parser.add_argument("--mmr", type=float, default=None, help="Lambda del MMR para diversificar los resultados (1 = solo relevancia; sin valor: no se usa)")
+    parser.add_argument("--cache", type=int, default=256, help="Búsquedas guardadas en la caché de consultas (0 = sin caché)")
+    parser.add_argument("--cache_ttl", type=float, default=None, help="Segundos de validez de cada búsqueda en caché (sin valor: no caducan)")
+    parser.add_argument("--top_documentos", type=int, default=None, help="Búsqueda en dos fases: documentos preseleccionados por su centroide (sin valor: se recorren todos los chunks)")
+    parser.add_argument("--expandir", type=int, default=0, help="Chunks vecinos que se añaden a cada lado de cada fragmento encontrado")
+    parser.add_argument("--recall", type=int, default=0, help="Consultas de muestra para el informe de recall@k")
+    parser.add_argument("--publicar", default=None, help="Publicar el índice en memoria compartida con este nombre")
+    parser.add_argument("--adjuntar", default=None, help="Usar el índice publicado con este nombre en lugar de construirlo")
+    parser.add_argument("--instantaneas", default=None, help="Directorio de instantáneas versionadas del índice (con CURRENT)")
+    parser.add_argument("--servir", action="store_true", help="Usar la instantánea actual de --instantaneas y recargar las nuevas en caliente")
+    parser.add_argument("--solo_construir", action="store_true", help="Construir el índice, publicarlo en --instantaneas y salir")
     args = parser.parse_args()
+    if (args.servir or args.solo_construir) and not args.instantaneas:
+        parser.error("--servir y --solo_construir necesitan --instantaneas")
+    if args.hnsw_m and (args.pq_m or args.int8):
+        parser.error("--pq_m/--int8 no se pueden combinar con --hnsw_m; usa --nlist (IVF-PQ)")
+    # Sin --reordenar, --pq_m descarta los vectores originales (con --int8, solo si se pide 0)
+    descarta_originales = (not args.reordenar) if args.pq_m else (args.int8 and args.reordenar == 0)
+    if args.publicar and descarta_originales:
+        parser.error("--publicar necesita conservar los vectores originales: usa --reordenar > 0 con --pq_m/--int8")
 
-    analisis = construir_indice(args.data, tam_chunk=args.chunk, modelo=args.modelo)
-    modo_interactivo(analisis, args.api_key)
+    if args.adjuntar:
+        analisis = AgenteAnalisis(modelo_name=args.modelo, hilos=args.hilos, lambda_mmr=args.mmr,
+                                  cache=args.cache, cache_ttl=args.cache_ttl)
+        analisis.adjuntar_indice(args.adjuntar)
+        print(f"[*] Índice compartido '{args.adjuntar}' adjuntado ({len(analisis.store)} chunks).")
+    elif args.servir:
+        analisis = AgenteAnalisis(modelo_name=args.modelo, hilos=args.hilos, hibrido=args.hibrido,
+                                  lambda_mmr=args.mmr, cache=args.cache, cache_ttl=args.cache_ttl,
+                                  top_documentos=args.top_documentos)
+        if analisis.vigilar_instantaneas(args.instantaneas) is None:
+            print(f"[!] No hay ninguna instantánea en {args.instantaneas}")
+            analisis.vigilante.detener()
+            return
+        print(f"[*] Instantánea cargada: {analisis.vigilante.actual} ({len(analisis.store)} chunks); "
+              "se recargará al publicarse otra.")
+    else:
+        analisis = construir_indice(args.data, tam_chunk=args.chunk, modelo=args.modelo,
+                                    nlist=args.nlist, nprobe=args.nprobe,
+                                    hnsw_m=args.hnsw_m, ef_busqueda=args.ef_search,
+                                    pq_m=args.pq_m, int8=args.int8, reordenar=args.reordenar,
+                                    dtype=args.dtype, hilos=args.hilos, deduplicar=args.deduplicar,
+                                    hibrido=args.hibrido, lambda_mmr=args.mmr,
+                                    cache=args.cache, cache_ttl=args.cache_ttl,
+                                    top_documentos=args.top_documentos)
+        if args.instantaneas:
+            print(f"[*] Instantánea publicada: {analisis.publicar_instantanea(args.instantaneas)}")
+        if args.solo_construir:
+            return
+    if args.publicar:
+        print(f"[*] Índice publicado en memoria compartida: {analisis.publicar_indice(args.publicar)}")
+    if args.recall:
+        try:
+            print(f"[*] {formatear_informe(analisis.informe_recall(n_consultas=args.recall))}")
+            if args.top_documentos:
+                for informe in analisis.informe_documentos(n_consultas=args.recall):
+                    print(f"[*] top_documentos={informe['top_documentos']}: {formatear_informe(informe)}")
+        except ValueError as e:
+            print(f"[!] No se pudo medir el recall: {e}")
+    try:
+        modo_interactivo(analisis, args.api_key, args.expandir)
+    finally:
+        if args.publicar:
+            analisis.store.dejar_de_publicar()
+        if analisis.vigilante is not None:
+            analisis.vigilante.detener()
 
 if __name__ == "__main__":
     main()
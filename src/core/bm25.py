@@ -0,0 +1,177 @@
+# src/core/bm25.py
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from src.core.buffers import ampliar
+
+# Palabras vacías frecuentes en español e inglés (sin tildes, como los tokens)
+PALABRAS_VACIAS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella
+ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos fue ha han hasta hay la las
+le les lo los mas me mi muy ni no nos o os otra otras otro otros para pero poco por porque que quien
+se sea ser si sin sobre son su sus tambien tanto te ti todo todos tu un una uno unos y ya yo
+about an and are as at be been but by can do does for from had has have he her his how i if in into
+is it its of on or our she so than that the their them then there these they this those to was we
+were what when which who will with you your
+""".split())
+
+_MARCAS = re.compile("[\u0300-\u036f]")  # Marcas diacríticas combinables (tildes, diéresis...)
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Tokens de un texto en español o inglés: minúsculas, sin tildes (ñ -> n),
+    sin palabras vacías y sin letras sueltas. Se conservan los tokens con
+    dígitos (códigos de asignatura, nombres de fórmulas...).
+    """
+    texto = _MARCAS.sub("", unicodedata.normalize("NFKD", texto.lower()))
+    return [t for t in _TOKEN.findall(texto)
+            if t not in PALABRAS_VACIAS and (len(t) > 1 or t.isdigit())]
+
+
+def fusion_rrf(rankings: Sequence[np.ndarray], top_k: int, k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fusión por rango recíproco (RRF): cada fila suma 1 / (k + posición) en
+    cada ranking en que aparece. Devuelve las top_k filas y su puntuación fusionada.
+    """
+    puntuaciones: Dict[int, float] = {}
+    for ranking in rankings:
+        for posicion, fila in enumerate(ranking.tolist(), start=1):
+            puntuaciones[fila] = puntuaciones.get(fila, 0.0) + 1.0 / (k + posicion)
+    mejores = sorted(puntuaciones.items(), key=lambda par: -par[1])[:top_k]
+    return (np.array([f for f, _ in mejores], dtype=np.int64),
+            np.array([p for _, p in mejores], dtype=np.float32))
+
+
+class IndiceBM25:
+    """
+    Índice invertido con puntuación BM25 sobre los textos de las filas del almacén.
+
+    Las listas de apariciones se guardan en segmentos compactos (estilo CSR):
+    términos ordenados, desplazamientos, filas int32 y frecuencias uint16.
+    Cada lote agregado crea un segmento nuevo, así que el índice es
+    incremental; cuando hay demasiados se fusionan en uno.
+    """
+
+    MAX_SEGMENTOS = 8
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            k1: Saturación de la frecuencia del término
+            b: Peso de la normalización por longitud del texto
+        """
+        self.k1 = k1
+        self.b = b
+        self._vocabulario: Dict[str, int] = {}
+        self._df = np.empty(0, dtype=np.int32)          # Filas en las que aparece cada término
+        self._longitudes = np.empty(0, dtype=np.int32)  # Tokens de cada fila
+        self._n = 0
+        self._segmentos: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def __len__(self) -> int:
+        return self._n
+
+    @staticmethod
+    def _segmento(terminos: np.ndarray, filas: np.ndarray, tf: np.ndarray):
+        """Ordena unas apariciones (término, fila, frecuencia) por término y las agrupa."""
+        orden = np.argsort(terminos, kind="stable")
+        terminos, filas, tf = terminos[orden], filas[orden], tf[orden]
+        unicos, inicios = np.unique(terminos, return_index=True)
+        inicios = np.append(inicios, len(terminos)).astype(np.int64)
+        return unicos.astype(np.int32), inicios, filas.astype(np.int32), tf.astype(np.uint16)
+
+    def agregar(self, textos: List[str]) -> None:
+        """Indexa los textos de nuevas filas (numeradas a continuación de las existentes)."""
+        terminos, filas, frecuencias = [], [], []
+        longitudes = np.zeros(len(textos), dtype=np.int32)
+        for j, texto in enumerate(textos):
+            conteo = Counter(tokenizar(texto))
+            longitudes[j] = sum(conteo.values())
+            for termino, tf in conteo.items():
+                terminos.append(self._vocabulario.setdefault(termino, len(self._vocabulario)))
+                filas.append(self._n + j)
+                frecuencias.append(min(tf, 65535))
+
+        self._longitudes = ampliar(self._longitudes, self._n, self._n + len(textos), 1024)
+        self._longitudes[self._n:self._n + len(textos)] = longitudes
+        # Cada término aparece una vez por fila en 'terminos': contar da la frecuencia documental
+        df = np.zeros(len(self._vocabulario), dtype=np.int32)
+        df[:len(self._df)] = self._df
+        self._df = df + np.bincount(np.array(terminos, dtype=np.int64), minlength=len(df)).astype(np.int32)
+        if terminos:
+            self._segmentos.append(self._segmento(np.array(terminos, dtype=np.int32),
+                                                  np.array(filas, dtype=np.int32),
+                                                  np.array(frecuencias, dtype=np.uint16)))
+        self._n += len(textos)
+        if len(self._segmentos) > self.MAX_SEGMENTOS:
+            self._fusionar()
+
+    def _fusionar(self, conservar: Optional[np.ndarray] = None) -> None:
+        """
+        Une todos los segmentos en uno. Si se da la máscara 'conservar',
+        descarta las filas que no están en ella y renumera las demás.
+        """
+        if not self._segmentos:
+            return
+        terminos = np.concatenate([np.repeat(t, np.diff(i)) for t, i, _, _ in self._segmentos])
+        filas = np.concatenate([f for _, _, f, _ in self._segmentos])
+        tf = np.concatenate([x for _, _, _, x in self._segmentos])
+        if conservar is not None:
+            mantener = conservar[filas]
+            terminos, filas, tf = terminos[mantener], (np.cumsum(conservar) - 1)[filas[mantener]], tf[mantener]
+        self._segmentos = [self._segmento(terminos, filas, tf)] if len(terminos) else []
+
+    def filtrar(self, conservar: np.ndarray) -> None:
+        """
+        Elimina filas del índice tras compactar el almacén. 'conservar' es la
+        máscara booleana de filas que siguen; las demás se renumeran en orden.
+        """
+        self._fusionar(conservar)
+        self._longitudes = self._longitudes[:self._n][conservar]
+        self._n = len(self._longitudes)
+        self._df = np.zeros(len(self._vocabulario), dtype=np.int32)
+        for terminos, inicios, _, _ in self._segmentos:
+            self._df[terminos] += np.diff(inicios).astype(np.int32)
+
+    def puntuar(self, consulta: str) -> np.ndarray:
+        """Puntuación BM25 de la consulta para cada fila (0 si no comparte términos)."""
+        puntuaciones = np.zeros(self._n, dtype=np.float32)
+        ids = [self._vocabulario[t] for t in set(tokenizar(consulta)) if t in self._vocabulario]
+        if not ids or not self._n:
+            return puntuaciones
+        longitudes = self._longitudes[:self._n].astype(np.float32)
+        norma = self.k1 * (1 - self.b + self.b * longitudes / max(float(longitudes.mean()), 1.0))
+        for termino in ids:
+            df = float(self._df[termino])
+            idf = np.log(1.0 + (self._n - df + 0.5) / (df + 0.5))
+            for terminos, inicios, filas, tf in self._segmentos:
+                k = np.searchsorted(terminos, termino)
+                if k == len(terminos) or terminos[k] != termino:
+                    continue
+                f = filas[inicios[k]:inicios[k + 1]]
+                frecuencia = tf[inicios[k]:inicios[k + 1]].astype(np.float32)
+                puntuaciones[f] += idf * frecuencia * (self.k1 + 1) / (frecuencia + norma[f])
+        return puntuaciones
+
+    def buscar(self, consulta: str, top_k: int,
+               validas: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filas con mayor puntuación BM25 (solo las que contienen algún término
+        de la consulta), ordenadas de mayor a menor. 'validas' es una máscara
+        opcional de filas que pueden devolverse.
+        """
+        puntuaciones = self.puntuar(consulta)
+        if validas is not None:
+            puntuaciones[~validas[:self._n]] = 0
+        candidatas = np.flatnonzero(puntuaciones > 0)
+        top_k = min(top_k, len(candidatas))
+        if top_k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        mejores = candidatas[np.argpartition(-puntuaciones[candidatas], top_k - 1)[:top_k]]
+        mejores = mejores[np.argsort(-puntuaciones[mejores], kind="stable")]
+        return mejores.astype(np.int64), puntuaciones[mejores]
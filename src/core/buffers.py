@@ -0,0 +1,16 @@
+# src/core/buffers.py
+import numpy as np
+
+
+def ampliar(buffer: np.ndarray, ocupadas: int, requerido: int, capacidad_minima: int) -> np.ndarray:
+    """
+    Devuelve un buffer con capacidad para 'requerido' filas, copiando las
+    'ocupadas' actuales. Si hace falta crecer, al menos duplica la capacidad.
+    """
+    capacidad = buffer.shape[0]
+    if requerido <= capacidad:
+        return buffer
+    nueva_capacidad = max(requerido, 2 * capacidad, capacidad_minima)
+    nuevo = np.empty((nueva_capacidad,) + buffer.shape[1:], dtype=buffer.dtype)
+    nuevo[:ocupadas] = buffer[:ocupadas]
+    return nuevo
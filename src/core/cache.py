@@ -0,0 +1,73 @@
+# src/core/cache.py
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Forma canónica de una pregunta: NFKC, minúsculas y espacios colapsados."""
+    return " ".join(unicodedata.normalize("NFKC", texto).lower().split())
+
+
+class CacheLRU:
+    """
+    Caché acotada con expulsión LRU y caducidad opcional (TTL).
+
+    Es segura entre hilos (Streamlit atiende cada sesión en un hilo) y lleva
+    la cuenta de aciertos y fallos para monitorizarla.
+    """
+
+    def __init__(self, capacidad: int = 256, ttl: Optional[float] = None):
+        """
+        Args:
+            capacidad: Entradas como máximo; al superarla se expulsa la usada hace más tiempo
+            ttl: Segundos que vale una entrada (None = no caducan)
+        """
+        if capacidad < 1:
+            raise ValueError("La capacidad de la caché debe ser al menos 1")
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (instante, valor)
+        self._cerrojo = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Valor guardado para la clave, o None si no está o ha caducado."""
+        with self._cerrojo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and self.ttl is not None and time.monotonic() - entrada[0] > self.ttl:
+                del self._entradas[clave]
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        with self._cerrojo:
+            self._entradas[clave] = (time.monotonic(), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self) -> None:
+        """Vacía la caché (los contadores se conservan)."""
+        with self._cerrojo:
+            self._entradas.clear()
+
+    def estadisticas(self) -> Dict[str, float]:
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+        }
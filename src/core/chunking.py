@@ -1,6 +1,6 @@
 # src/core/chunking.py
 import re
-from typing import List
+from typing import List, Tuple
 
 def limpiar_texto(texto: str) -> str:
     # limpia saltos de línea extras y espacios repetidos
@@ -8,21 +8,38 @@ def limpiar_texto(texto: str) -> str:
     t = re.sub(r"\s+", " ", t)
     return t.strip()
 
-def crear_chunks(texto: str, tam: int = 300, salto: int = 50) -> List[str]:
+def crear_spans(texto: str, tam: int = 300, salto: int = 50) -> Tuple[str, List[Tuple[int, int]]]:
     """
-    Divide el texto en chunks de 'tam' palabras con solapamiento 'salto'.
-    tam: tamaño en palabras
-    salto: número de palabras que se solapan entre chunks (overlap)
+    Divide el texto en chunks de 'tam' palabras con solapamiento 'salto', pero
+    sin copiar el texto: devuelve el texto normalizado (limpiar_texto) y la
+    posición [inicio, fin) en caracteres de cada chunk dentro de él.
     """
     texto = limpiar_texto(texto)
-    palabras = texto.split()
-    if not palabras:
-        return []
-    chunks = []
+    palabras = [(m.start(), m.end()) for m in re.finditer(r"\S+", texto)]
+    spans = []
     i = 0
     n = len(palabras)
     while i < n:
-        chunk = palabras[i:i+tam]
-        chunks.append(" ".join(chunk))
+        spans.append((palabras[i][0], palabras[min(i + tam, n) - 1][1]))
         i += tam - salto  # solapamiento
-    return chunks
+    return texto, spans
+
+def crear_chunks(texto: str, tam: int = 300, salto: int = 50) -> List[str]:
+    """
+    Divide el texto en chunks de 'tam' palabras con solapamiento 'salto'.
+    tam: tamaño en palabras
+    salto: número de palabras que se solapan entre chunks (overlap)
+    """
+    texto, spans = crear_spans(texto, tam, salto)
+    return [texto[inicio:fin] for inicio, fin in spans]
+
+def unir_solapados(anterior: str, siguiente: str) -> str:
+    """
+    Une dos chunks consecutivos sin repetir las palabras con las que
+    'siguiente' empieza y 'anterior' termina (el solapamiento de crear_chunks).
+    """
+    a, b = anterior.split(), siguiente.split()
+    for k in range(min(len(a), len(b)), 0, -1):
+        if a[-k:] == b[:k]:
+            return " ".join(a + b[k:])
+    return " ".join(a + b)
@@ -0,0 +1,169 @@
+# src/core/cuantizacion.py
+import numpy as np
+
+
+def kmeans(vectores: np.ndarray, k: int, iteraciones: int = 20, semilla: int = 0) -> np.ndarray:
+    """
+    k-means euclídeo sencillo. Devuelve los k centroides (k, dim).
+    """
+    rng = np.random.default_rng(semilla)
+    vectores = np.asarray(vectores, dtype=np.float32)
+    centroides = vectores[rng.choice(len(vectores), k, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignaciones = asignar_centroides(vectores, centroides)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignaciones, vectores)
+        conteos = np.bincount(asignaciones, minlength=k)
+        vacios = conteos == 0
+        centroides = sumas / np.maximum(conteos, 1)[:, None]
+        # Los centroides vacíos se reinician con puntos aleatorios
+        if vacios.any():
+            centroides[vacios] = vectores[rng.choice(len(vectores), int(vacios.sum()), replace=False)]
+    return centroides.astype(np.float32)
+
+
+def asignar_centroides(vectores: np.ndarray, centroides: np.ndarray, tam_bloque: int = 65536) -> np.ndarray:
+    """
+    Índice del centroide más cercano (distancia euclídea) de cada vector, por bloques.
+    """
+    normas_c = (centroides ** 2).sum(axis=1)
+    asignaciones = np.empty(len(vectores), dtype=np.int64)
+    for inicio in range(0, len(vectores), tam_bloque):
+        bloque = vectores[inicio:inicio + tam_bloque]
+        # ||x - c||² = ||x||² - 2 x·c + ||c||²; ||x||² no cambia el argmin
+        distancias = normas_c[None, :] - 2 * (bloque @ centroides.T)
+        asignaciones[inicio:inicio + len(bloque)] = np.argmin(distancias, axis=1)
+    return asignaciones
+
+
+class CuantizadorPQ:
+    """
+    Cuantización por producto (PQ).
+
+    Divide cada vector en 'm' subvectores y sustituye cada uno por el índice
+    (uint8) del centroide más cercano de su subespacio, así que un vector
+    ocupa 'm' bytes en lugar de 4*dim. Las búsquedas usan distancia asimétrica:
+    la consulta se mantiene en float32 y se precalcula una tabla con su
+    producto escalar contra todos los centroides de cada subespacio.
+    """
+
+    dtype = np.uint8
+
+    def __init__(self, dim: int, m: int = 48, iteraciones: int = 20, semilla: int = 0):
+        """
+        Args:
+            dim: Dimensión de los vectores
+            m: Número de subespacios (bytes por vector); debe dividir a dim
+            iteraciones: Iteraciones de k-means por subespacio
+            semilla: Semilla para la inicialización de k-means
+
+        Raises:
+            ValueError: Si m no divide a dim
+        """
+        if dim % m != 0:
+            raise ValueError(f"m ({m}) debe dividir a la dimensión de los vectores ({dim})")
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.iteraciones = iteraciones
+        self.semilla = semilla
+        self.codebooks = None  # (m, k, dsub)
+
+    @property
+    def ancho(self) -> int:
+        """Columnas de la matriz de códigos."""
+        return self.m
+
+    def _subvectores(self, vectores: np.ndarray) -> np.ndarray:
+        return np.asarray(vectores, dtype=np.float32).reshape(len(vectores), self.m, self.dsub)
+
+    def entrenar(self, vectores: np.ndarray) -> None:
+        """Entrena un codebook de hasta 256 centroides por subespacio."""
+        k = min(256, len(vectores))
+        sub = self._subvectores(vectores)
+        self.codebooks = np.stack([
+            kmeans(sub[:, j], k, self.iteraciones, self.semilla + j) for j in range(self.m)
+        ])
+
+    def codificar(self, vectores: np.ndarray) -> np.ndarray:
+        """Convierte vectores (n, dim) en códigos uint8 (n, m)."""
+        sub = self._subvectores(vectores)
+        codigos = np.empty((len(sub), self.m), dtype=self.dtype)
+        for j in range(self.m):
+            codigos[:, j] = asignar_centroides(sub[:, j], self.codebooks[j])
+        return codigos
+
+    def reconstruir(self, codigos: np.ndarray) -> np.ndarray:
+        """Aproximación float32 (n, dim) de los vectores codificados."""
+        partes = [self.codebooks[j][codigos[:, j]] for j in range(self.m)]
+        return np.concatenate(partes, axis=1)
+
+    def puntuar(self, codigos: np.ndarray, consultas: np.ndarray) -> np.ndarray:
+        """
+        Producto escalar aproximado (q, n) entre las consultas y los vectores codificados.
+        """
+        # tablas[q, j, c] = <subconsulta j, centroide c del subespacio j>
+        tablas = np.einsum("qjd,jkd->qjk", self._subvectores(consultas), self.codebooks)
+        similitudes = np.zeros((len(consultas), len(codigos)), dtype=np.float32)
+        for j in range(self.m):
+            similitudes += tablas[:, j, :][:, codigos[:, j]]
+        return similitudes
+
+
+class CuantizadorEscalar:
+    """
+    Cuantización escalar int8 simétrica por dimensión.
+
+    Cada componente se guarda como un entero en [-127, 127] con una escala
+    por dimensión (max |x_d| / 127), así que un vector ocupa 'dim' bytes en
+    lugar de 4*dim. La consulta también se cuantiza a int8 y el primer
+    pase de la búsqueda es un producto escalar entero.
+    """
+
+    dtype = np.int8
+    TAM_BLOQUE = 65536  # Filas que se convierten a la vez al puntuar
+    REORDENAR = 4  # Factor de re-puntuación por defecto: el int8 solo es el primer pase
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.escalas = None  # (dim,)
+
+    @property
+    def ancho(self) -> int:
+        """Columnas de la matriz de códigos."""
+        return self.dim
+
+    def entrenar(self, vectores: np.ndarray) -> None:
+        """Calcula la escala de cada dimensión a partir de su valor absoluto máximo."""
+        maximos = np.abs(np.asarray(vectores, dtype=np.float32)).max(axis=0)
+        maximos[maximos == 0] = 1.0
+        self.escalas = (maximos / 127).astype(np.float32)
+
+    def codificar(self, vectores: np.ndarray) -> np.ndarray:
+        """Convierte vectores (n, dim) en códigos int8 (n, dim)."""
+        codigos = np.rint(np.asarray(vectores, dtype=np.float32) / self.escalas)
+        return np.clip(codigos, -127, 127).astype(self.dtype)
+
+    def reconstruir(self, codigos: np.ndarray) -> np.ndarray:
+        """Aproximación float32 (n, dim) de los vectores codificados."""
+        return codigos.astype(np.float32) * self.escalas
+
+    def puntuar(self, codigos: np.ndarray, consultas: np.ndarray) -> np.ndarray:
+        """
+        Producto escalar aproximado (q, n) entre las consultas y los vectores codificados.
+        """
+        # q·x ≈ Σ (q_d * s_d) * c_d; la consulta escalada se cuantiza a int8 con una escala propia
+        escaladas = np.asarray(consultas, dtype=np.float32) * self.escalas
+        escala_consulta = np.abs(escaladas).max(axis=1) / 127
+        escala_consulta[escala_consulta == 0] = 1.0
+        consultas_int = np.rint(escaladas / escala_consulta[:, None]).astype(self.dtype)
+
+        # Los productos de enteros int8 se acumulan en float32 por bloques: son exactos
+        # mientras la suma no supere 2**24 (dim < ~1000) y así se aprovecha BLAS
+        consultas_f = consultas_int.astype(np.float32)
+        similitudes = np.empty((len(consultas), len(codigos)), dtype=np.float32)
+        for inicio in range(0, len(codigos), self.TAM_BLOQUE):
+            bloque = codigos[inicio:inicio + self.TAM_BLOQUE].astype(np.float32)
+            similitudes[:, inicio:inicio + len(bloque)] = consultas_f @ bloque.T
+        similitudes *= escala_consulta[:, None]
+        return similitudes
@@ -0,0 +1,43 @@
+# src/core/diversidad.py
+import numpy as np
+
+
+def mmr(consulta: np.ndarray, candidatos: np.ndarray, top_k: int, lambda_: float = 0.5) -> np.ndarray:
+    """
+    Selección por relevancia marginal máxima (MMR) entre unos candidatos.
+
+    En cada paso se elige el candidato que maximiza
+        lambda_ * sim(consulta, c) - (1 - lambda_) * max sim(c, elegidos)
+    de modo que los chunks casi iguales a uno ya elegido (p. ej. los vecinos
+    que comparten el solapamiento de crear_chunks) pierden prioridad.
+
+    Las similitudes se calculan de una vez como productos de matrices y la
+    máxima similitud con los elegidos se actualiza de forma vectorizada; el
+    único bucle es el de los top_k pasos.
+
+    Args:
+        consulta: Vector de consulta normalizado (dim,)
+        candidatos: Vectores normalizados de los candidatos (n, dim)
+        top_k: Número de candidatos a elegir
+        lambda_: 1 = solo relevancia (orden original), 0 = solo diversidad
+
+    Returns:
+        Posiciones (int64) en 'candidatos' de los elegidos, en orden de selección
+    """
+    candidatos = np.asarray(candidatos, dtype=np.float32)
+    top_k = min(top_k, len(candidatos))
+    if top_k == 0:
+        return np.empty(0, dtype=np.int64)
+    relevancia = candidatos @ np.asarray(consulta, dtype=np.float32)
+    similitudes = candidatos @ candidatos.T  # (n, n)
+
+    elegidos = np.empty(top_k, dtype=np.int64)
+    maxima = np.full(len(candidatos), -np.inf, dtype=np.float32)  # Máxima similitud con los elegidos
+    valor = lambda_ * relevancia  # Sin elegidos todavía no hay redundancia
+    for paso in range(top_k):
+        elegido = int(np.argmax(valor))
+        elegidos[paso] = elegido
+        np.maximum(maxima, similitudes[elegido], out=maxima)
+        valor = lambda_ * relevancia - (1 - lambda_) * maxima
+        valor[elegidos[:paso + 1]] = -np.inf
+    return elegidos
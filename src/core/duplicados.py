@@ -0,0 +1,119 @@
+# src/core/duplicados.py
+import hashlib
+import re
+import zlib
+from typing import Dict, List, Tuple
+import numpy as np
+
+PRIMO = 4294967311  # Primo > 2^32 para las permutaciones de MinHash
+
+
+def normalizar_para_hash(texto: str) -> str:
+    """Minúsculas, sin puntuación y con los espacios colapsados."""
+    return re.sub(r"\W+", " ", texto.lower()).strip()
+
+
+class DetectorDuplicados:
+    """
+    Detecta chunks duplicados o casi duplicados (p. ej. la misma diapositiva,
+    cabecera o pie de página repetidos en varios PDFs).
+
+    - Duplicado exacto: mismo hash del texto normalizado.
+    - Casi duplicado: firma MinHash de los 'tam_shingle'-gramas de palabras,
+      indexada con LSH por bandas; los candidatos que comparten alguna banda
+      se confirman si la similitud de Jaccard estimada llega a 'umbral'.
+
+    Recuerda los representantes ya vistos: cada texto se compara con todos
+    los registrados antes.
+    """
+
+    def __init__(self, umbral: float = 0.85, permutaciones: int = 64, bandas: int = 8,
+                 tam_shingle: int = 3, semilla: int = 0):
+        """
+        Args:
+            umbral: Similitud de Jaccard estimada a partir de la cual dos chunks son duplicados
+            permutaciones: Longitud de la firma MinHash
+            bandas: Bandas del LSH (deben dividir a 'permutaciones')
+            tam_shingle: Palabras por shingle
+            semilla: Semilla de las permutaciones
+        """
+        if permutaciones % bandas:
+            raise ValueError("El número de bandas debe dividir al de permutaciones")
+        self.umbral = umbral
+        self.bandas = bandas
+        self.filas_banda = permutaciones // bandas
+        self.tam_shingle = tam_shingle
+        rng = np.random.default_rng(semilla)
+        self._a = rng.integers(1, 2**31, size=(permutaciones, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 2**31, size=(permutaciones, 1), dtype=np.uint64)
+        self._exactos: Dict[bytes, int] = {}         # hash del texto -> representante
+        self._cubetas: Dict[Tuple[int, bytes], List[int]] = {}  # (banda, valores) -> representantes
+        self._firmas: Dict[int, np.ndarray] = {}      # representante -> firma MinHash
+
+    def minhash(self, texto: str) -> np.ndarray:
+        """Firma MinHash (uint64) del texto normalizado."""
+        palabras = texto.split()
+        k = min(self.tam_shingle, max(len(palabras), 1))
+        shingles = {" ".join(palabras[i:i + k]) for i in range(max(len(palabras) - k + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a * x + self._b) % PRIMO).min(axis=1)
+
+    def _claves_lsh(self, firma: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(b, firma[b * self.filas_banda:(b + 1) * self.filas_banda].tobytes())
+                for b in range(self.bandas)]
+
+    def representante(self, texto: str, identificador: int) -> int:
+        """
+        Devuelve el identificador del chunk ya visto del que 'texto' es
+        duplicado o, si no lo es de ninguno, registra 'identificador' como
+        representante nuevo y lo devuelve.
+        """
+        normalizado = normalizar_para_hash(texto)
+        exacto = hashlib.blake2b(normalizado.encode("utf-8"), digest_size=16).digest()
+        if exacto in self._exactos:
+            return self._exactos[exacto]
+
+        firma = self.minhash(normalizado)
+        claves = self._claves_lsh(firma)
+        candidatos = {r for clave in claves for r in self._cubetas.get(clave, ())}
+        for r in sorted(candidatos):
+            if np.mean(self._firmas[r] == firma) >= self.umbral:
+                self._exactos[exacto] = r
+                return r
+
+        self._exactos[exacto] = identificador
+        self._firmas[identificador] = firma
+        for clave in claves:
+            self._cubetas.setdefault(clave, []).append(identificador)
+        return identificador
+
+
+def colapsar_duplicados(chunks_meta: List[dict], textos: List[str],
+                        umbral: float = 0.85) -> Tuple[List[dict], List[int]]:
+    """
+    Agrupa los chunks duplicados y se queda con uno por grupo (el primero).
+    Si un grupo tiene varios chunks, el representante lleva en 'fuentes' la
+    lista de todas sus ubicaciones ({"documento", "chunk_id"}).
+
+    Args:
+        chunks_meta: Metadatos de los chunks
+        textos: Texto de cada chunk
+        umbral: Similitud de Jaccard estimada para considerar dos chunks duplicados
+
+    Returns:
+        Metadatos de los representantes y su posición en chunks_meta
+    """
+    detector = DetectorDuplicados(umbral)
+    grupos: Dict[int, List[int]] = {}
+    for i, texto in enumerate(textos):
+        grupos.setdefault(detector.representante(texto, i), []).append(i)
+
+    unicos, posiciones = [], []
+    for representante, miembros in grupos.items():
+        meta = dict(chunks_meta[representante])
+        if len(miembros) > 1:
+            meta["fuentes"] = [{"documento": chunks_meta[m].get("documento"),
+                                "chunk_id": chunks_meta[m].get("chunk_id")} for m in miembros]
+        unicos.append(meta)
+        posiciones.append(representante)
+    return unicos, posiciones
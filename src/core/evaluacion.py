@@ -0,0 +1,62 @@
+# src/core/evaluacion.py
+import time
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+# Función de búsqueda: (consultas (q, dim), top_k) -> [(filas, puntuaciones), ...] por consulta
+FuncionBusqueda = Callable[[np.ndarray, int], List[Tuple[np.ndarray, np.ndarray]]]
+
+
+def recall_at_k(exactos: List[np.ndarray], aproximados: List[np.ndarray]) -> float:
+    """
+    Fracción media de los vecinos exactos que recupera la búsqueda aproximada.
+    """
+    if not exactos:
+        return 0.0
+    aciertos = [
+        len(np.intersect1d(e, a)) / len(e)
+        for e, a in zip(exactos, aproximados) if len(e)
+    ]
+    return float(np.mean(aciertos)) if aciertos else 0.0
+
+
+def muestrear_consultas(embeddings: np.ndarray, n: int = 100, semilla: int = 0) -> np.ndarray:
+    """
+    Toma n vectores al azar del corpus para usarlos como consultas de prueba.
+    """
+    rng = np.random.default_rng(semilla)
+    n = min(n, len(embeddings))
+    return np.asarray(embeddings[np.sort(rng.choice(len(embeddings), n, replace=False))], dtype=np.float32)
+
+
+def comparar_busquedas(buscar_exacto: FuncionBusqueda, buscar_aproximado: FuncionBusqueda,
+                       consultas: np.ndarray, top_k: int = 10) -> Dict[str, float]:
+    """
+    Ejecuta ambas búsquedas sobre las mismas consultas y devuelve el recall@k
+    de la aproximada respecto a la exacta junto con la latencia media de cada una.
+    """
+    inicio = time.perf_counter()
+    exactos = buscar_exacto(consultas, top_k)
+    t_exacto = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    aproximados = buscar_aproximado(consultas, top_k)
+    t_aproximado = time.perf_counter() - inicio
+
+    n = max(len(consultas), 1)
+    return {
+        "consultas": len(consultas),
+        "top_k": top_k,
+        "recall": recall_at_k([f for f, _ in exactos], [f for f, _ in aproximados]),
+        "ms_exacto": 1000 * t_exacto / n,
+        "ms_aproximado": 1000 * t_aproximado / n,
+    }
+
+
+def formatear_informe(informe: Dict[str, float]) -> str:
+    """Texto de una línea con el resultado de comparar_busquedas."""
+    return (f"recall@{informe['top_k']}={informe['recall']:.3f} "
+            f"({informe['consultas']} consultas) | "
+            f"exacta {informe['ms_exacto']:.2f} ms/consulta, "
+            f"aproximada {informe['ms_aproximado']:.2f} ms/consulta")
+
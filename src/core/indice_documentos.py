@@ -0,0 +1,95 @@
+# src/core/indice_documentos.py
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.core.buffers import ampliar
+
+
+class IndiceDocumentos:
+    """
+    Centroide (media normalizada de los embeddings de sus chunks) de cada
+    documento, para la búsqueda en dos fases: primero los documentos más
+    parecidos a la consulta y después solo los chunks de esos documentos.
+
+    Se guardan las sumas de los vectores y el número de chunks de cada
+    documento, así que agregar chunks actualiza el centroide sin recorrer
+    los anteriores. Un chunk compartido por varios documentos (con 'fuentes')
+    cuenta en todos ellos.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._nombres: List[Any] = []          # Documento de cada posición
+        self._posicion: Dict[Any, int] = {}    # documento -> posición
+        self._sumas = np.empty((0, dim), dtype=np.float32)
+        self._cuentas = np.empty(0, dtype=np.int64)
+        self._normalizados: Optional[np.ndarray] = None  # Caché de centroides()
+
+    def __len__(self) -> int:
+        return len(self._posicion)
+
+    def agregar(self, documentos: List[Any], embs: np.ndarray) -> None:
+        """
+        Suma los embeddings (normalizados) de nuevas filas a los centroides
+        de sus documentos. 'documentos' tiene, por fila, el nombre del
+        documento, una tupla de nombres o None.
+        """
+        previas = len(self._nombres)
+        posiciones, filas = [], []
+        for fila, documento in enumerate(documentos):
+            for nombre in (documento if isinstance(documento, tuple) else (documento,)):
+                if nombre is None:
+                    continue
+                if nombre not in self._posicion:
+                    self._posicion[nombre] = len(self._nombres)
+                    self._nombres.append(nombre)
+                posiciones.append(self._posicion[nombre])
+                filas.append(fila)
+        n = len(self._nombres)
+        self._sumas = ampliar(self._sumas, previas, n, 64)
+        self._cuentas = ampliar(self._cuentas, previas, n, 64)
+        self._sumas[previas:n] = 0
+        self._cuentas[previas:n] = 0
+        if posiciones:
+            posiciones = np.array(posiciones, dtype=np.int64)
+            np.add.at(self._sumas, posiciones, np.asarray(embs, dtype=np.float32)[filas])
+            np.add.at(self._cuentas, posiciones, 1)
+        self._normalizados = None
+
+    def eliminar(self, nombre: Any) -> None:
+        """Quita un documento; su posición queda vacía y no se vuelve a proponer."""
+        posicion = self._posicion.pop(nombre, None)
+        if posicion is not None:
+            self._sumas[posicion] = 0
+            self._cuentas[posicion] = 0
+            self._normalizados = None
+
+    def centroides(self) -> np.ndarray:
+        """Centroides normalizados (una fila por posición; ceros en las vacías)."""
+        if self._normalizados is None:
+            sumas = self._sumas[:len(self._nombres)]
+            normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+            normas[normas == 0] = 1.0
+            self._normalizados = sumas / normas
+        return self._normalizados
+
+    def cercanos(self, consulta: np.ndarray, d: int,
+                 permitidos: Optional[Iterable[Any]] = None) -> List[Any]:
+        """
+        Los 'd' documentos cuyo centroide es más parecido a la consulta
+        (normalizada), de más a menos parecido. Si se da 'permitidos', solo
+        se eligen entre esos documentos.
+        """
+        similitudes = self.centroides() @ np.asarray(consulta, dtype=np.float32)
+        validos = self._cuentas[:len(self._nombres)] > 0
+        if permitidos is not None:
+            elegibles = np.zeros(len(self._nombres), dtype=bool)
+            elegibles[[self._posicion[p] for p in permitidos if p in self._posicion]] = True
+            validos &= elegibles
+        candidatos = np.flatnonzero(validos)
+        d = min(d, len(candidatos))
+        if d == 0:
+            return []
+        mejores = candidatos[np.argpartition(-similitudes[candidatos], d - 1)[:d]]
+        mejores = mejores[np.argsort(-similitudes[mejores], kind="stable")]
+        return [self._nombres[p] for p in mejores.tolist()]
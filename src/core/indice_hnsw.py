@@ -0,0 +1,301 @@
+# src/core/indice_hnsw.py
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from src.core.buffers import ampliar
+
+
+class IndiceHNSW:
+    """
+    Índice aproximado HNSW (Hierarchical Navigable Small World).
+
+    Mantiene un grafo por niveles sobre las filas del almacén: los niveles
+    altos tienen pocos nodos y enlaces largos, y el nivel 0 contiene todos
+    los nodos. La búsqueda desciende de forma voraz por los niveles y hace
+    una búsqueda en anchura acotada por 'ef_busqueda' en el nivel 0, por lo
+    que su coste crece de forma logarítmica con el corpus.
+
+    Los vecinos de cada nivel se guardan en una matriz (filas, máximo) con -1
+    en los huecos, de modo que la búsqueda expande varios nodos a la vez con
+    operaciones de NumPy (vecinos, visitados y similitudes de un lote de una
+    vez) en lugar de recorrerlos uno a uno. Los vecinos se eligen con la
+    heurística de HNSW, que conserva enlaces hacia otras zonas del espacio:
+    quedarse solo con los más parecidos deja aislados los grupos de chunks
+    de un mismo tema.
+
+    El índice no guarda los vectores: trabaja sobre la matriz (normalizada)
+    del VectorStore, que se le pasa en cada llamada.
+    """
+
+    LOTE = 16  # Nodos que se expanden a la vez en cada paso de la búsqueda
+
+    def __init__(self, M: int = 16, ef_construccion: int = 200, ef_busqueda: int = 64, semilla: int = 0):
+        """
+        Args:
+            M: Vecinos por nodo en los niveles superiores (2*M en el nivel 0)
+            ef_construccion: Tamaño de la lista de candidatos al insertar
+            ef_busqueda: Tamaño de la lista de candidatos al buscar
+            semilla: Semilla para sortear el nivel de cada nodo
+        """
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construccion = ef_construccion
+        self.ef_busqueda = ef_busqueda
+        self._mult_nivel = 1 / np.log(max(M, 2))
+        self._rng = np.random.default_rng(semilla)
+        self._vecinos: List[np.ndarray] = []          # vecinos[nivel][fila] -> nodos (-1 = hueco)
+        self._filas: List[Dict[int, int]] = []        # filas[nivel][nodo] -> fila (vacío en el nivel 0: fila = nodo)
+        self._entrada: Optional[int] = None           # Nodo de entrada, siempre en el nivel más alto
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __setstate__(self, estado: dict) -> None:
+        # Índices guardados con el formato anterior: grafo[nivel][nodo] -> lista de vecinos
+        grafo = estado.pop("_grafo", None)
+        self.__dict__.update(estado)
+        if grafo is not None:
+            self._vecinos, self._filas = [], []
+            for nivel, vecinos_nivel in enumerate(grafo):
+                for nodo in sorted(vecinos_nivel):
+                    fila = self._alta(nivel, nodo)
+                    vecinos = vecinos_nivel[nodo][:self._maximo(nivel)]
+                    self._vecinos[nivel][fila, :len(vecinos)] = vecinos
+
+    def _maximo(self, nivel: int) -> int:
+        return self.M0 if nivel == 0 else self.M
+
+    def _alta(self, nivel: int, nodo: int) -> int:
+        """Reserva una fila vacía para el nodo en el nivel (creándolo si hace falta) y la devuelve."""
+        if nivel == len(self._vecinos):
+            self._vecinos.append(np.empty((0, self._maximo(nivel)), dtype=np.int64))
+            self._filas.append({})
+        if nivel == 0:
+            fila, ocupadas = nodo, nodo
+        else:
+            fila = ocupadas = len(self._filas[nivel])
+            self._filas[nivel][nodo] = fila
+        self._vecinos[nivel] = ampliar(self._vecinos[nivel], ocupadas, fila + 1, 1024 if nivel == 0 else 64)
+        self._vecinos[nivel][fila] = -1
+        return fila
+
+    def _fila(self, nivel: int, nodos: np.ndarray) -> np.ndarray:
+        if nivel == 0:
+            return nodos
+        filas = self._filas[nivel]
+        return np.array([filas[n] for n in nodos.tolist()], dtype=np.int64)
+
+    @staticmethod
+    def _vectores(embeddings: np.ndarray, nodos: np.ndarray) -> np.ndarray:
+        return np.asarray(embeddings[nodos], dtype=np.float32)
+
+    def _buscar_nivel(self, embeddings: np.ndarray, consulta: np.ndarray, entradas: np.ndarray,
+                      ef: int, nivel: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda acotada en un nivel. Devuelve hasta 'ef' nodos y sus
+        similitudes, ordenados de mayor a menor similitud.
+
+        Se mantienen los 'ef' mejores nodos vistos y en cada paso se expanden
+        a la vez los LOTE mejores aún sin expandir; termina cuando todos los
+        que siguen entre los 'ef' mejores se han expandido.
+        """
+        vecinos = self._vecinos[nivel]
+        # 0 = sin visitar; al visitar un lote se numera, lo que también quita sus repetidos
+        visitados = np.zeros(len(embeddings), dtype=np.int32)
+        nodos = np.unique(entradas)
+        visitados[nodos] = 1
+        sims = self._vectores(embeddings, nodos) @ consulta
+        expandidos = np.zeros(len(nodos), dtype=bool)
+        while True:
+            pendientes = np.flatnonzero(~expandidos)
+            if len(pendientes) == 0:
+                break
+            if len(pendientes) > self.LOTE:
+                pendientes = pendientes[np.argpartition(-sims[pendientes], self.LOTE - 1)[:self.LOTE]]
+            expandidos[pendientes] = True
+            nuevos = vecinos[self._fila(nivel, nodos[pendientes])].ravel()
+            nuevos = nuevos[nuevos >= 0]
+            nuevos = nuevos[visitados[nuevos] == 0]
+            if len(nuevos) == 0:
+                continue
+            numeros = np.arange(1, len(nuevos) + 1, dtype=np.int32)
+            visitados[nuevos] = numeros
+            nuevos = nuevos[visitados[nuevos] == numeros]
+            nodos = np.concatenate([nodos, nuevos])
+            sims = np.concatenate([sims, self._vectores(embeddings, nuevos) @ consulta])
+            expandidos = np.concatenate([expandidos, np.zeros(len(nuevos), dtype=bool)])
+            if len(nodos) > ef:
+                mejores = np.argpartition(-sims, ef - 1)[:ef]
+                nodos, sims, expandidos = nodos[mejores], sims[mejores], expandidos[mejores]
+        orden = np.argsort(-sims, kind="stable")
+        return nodos[orden], sims[orden]
+
+    def _seleccionar(self, embeddings: np.ndarray, candidatos: np.ndarray, sims: np.ndarray,
+                     maximo: int) -> np.ndarray:
+        """
+        Heurística de selección de vecinos de HNSW: recorriendo los candidatos
+        de más a menos parecido a la base, uno se elige solo si se parece más
+        a la base que a cualquiera de los ya elegidos.
+
+        Args:
+            candidatos: Nodos ordenados de mayor a menor similitud con la base
+            sims: Sus similitudes con la base
+            maximo: Vecinos como máximo
+        """
+        if len(candidatos) <= maximo:
+            return candidatos
+        vectores = self._vectores(embeddings, candidatos)
+        maxima = np.full(len(candidatos), -np.inf, dtype=np.float32)  # Máxima similitud con los elegidos
+        elegidos: List[int] = []
+        inicio = 0
+        while len(elegidos) < maximo:
+            validos = np.flatnonzero(sims[inicio:] > maxima[inicio:])
+            if len(validos) == 0:
+                break
+            elegido = inicio + int(validos[0])
+            elegidos.append(elegido)
+            np.maximum(maxima, vectores @ vectores[elegido], out=maxima)
+            inicio = elegido + 1
+        return candidatos[elegidos]
+
+    def _enlazar(self, embeddings: np.ndarray, nodo: int, elegidos: np.ndarray, nivel: int) -> None:
+        """
+        Añade el enlace de vuelta de cada vecino elegido al nodo nuevo, todos
+        a la vez. En los vecinos sin huecos se aplica la heurística de forma
+        incremental: el nodo no entra si ya lo cubre un vecino más cercano a
+        la base y, si entra, sustituye al vecino que él cubre (o al más
+        lejano, si es más lejano que el nodo).
+        """
+        vecinos = self._vecinos[nivel]
+        filas = self._fila(nivel, elegidos)
+        huecos = vecinos[filas] < 0
+        libres = huecos.any(axis=1)
+        vecinos[filas[libres], huecos[libres].argmax(axis=1)] = nodo
+        if libres.all():
+            return
+        filas, bases = filas[~libres], elegidos[~libres]
+        actuales = vecinos[filas]                                       # (k, maximo)
+        v_actuales = self._vectores(embeddings, actuales)               # (k, maximo, dim)
+        v_bases = self._vectores(embeddings, bases)                     # (k, dim)
+        v_nodo = self._vectores(embeddings, nodo)                       # (dim,)
+        sim_base = np.einsum("kmd,kd->km", v_actuales, v_bases)         # vecino - base
+        sim_nodo = v_actuales @ v_nodo                                  # vecino - nodo nuevo
+        sim_nueva = (v_bases @ v_nodo)[:, None]                         # base - nodo nuevo
+        cubierto = ((sim_base > sim_nueva) & (sim_nodo > sim_nueva)).any(axis=1)
+        cubre = (sim_base < sim_nueva) & (sim_nodo > sim_base)
+        # Primero sale un vecino cubierto por el nodo nuevo; si no hay, el más lejano
+        sale = np.where(cubre, 2 + sim_nodo - sim_base, -sim_base).argmax(axis=1)
+        entra = ~cubierto & (cubre.any(axis=1) | (sim_nueva[:, 0] > sim_base.min(axis=1)))
+        vecinos[filas[entra], sale[entra]] = nodo
+
+    def _insertar(self, embeddings: np.ndarray, nodo: int) -> None:
+        nivel_nodo = int(-np.log(1.0 - self._rng.random()) * self._mult_nivel)
+        nivel_max = len(self._vecinos) - 1
+        for nivel in range(nivel_nodo + 1):
+            self._alta(nivel, nodo)
+        if self._entrada is None:
+            self._entrada = nodo
+            return
+
+        consulta = self._vectores(embeddings, nodo)
+        entradas = np.array([self._entrada], dtype=np.int64)
+        # Descenso voraz por los niveles por encima del nodo nuevo
+        for nivel in range(nivel_max, nivel_nodo, -1):
+            entradas = self._buscar_nivel(embeddings, consulta, entradas, 1, nivel)[0]
+
+        for nivel in range(min(nivel_nodo, nivel_max), -1, -1):
+            encontrados, sims = self._buscar_nivel(embeddings, consulta, entradas, self.ef_construccion, nivel)
+            otros = encontrados != nodo
+            elegidos = self._seleccionar(embeddings, encontrados[otros], sims[otros], self._maximo(nivel))
+            self._vecinos[nivel][self._fila(nivel, np.array([nodo]))[0], :len(elegidos)] = elegidos
+            self._enlazar(embeddings, nodo, elegidos, nivel)
+            entradas = encontrados
+
+        if nivel_nodo > nivel_max:
+            self._entrada = nodo
+
+    def agregar(self, embeddings: np.ndarray) -> None:
+        """
+        Inserta en el grafo las filas de 'embeddings' que aún no están indexadas.
+
+        Args:
+            embeddings: Matriz completa (normalizada) del almacén, incluidas las filas nuevas
+        """
+        for nodo in range(self._n, len(embeddings)):
+            self._insertar(embeddings, nodo)
+        self._n = len(embeddings)
+
+    def filtrar(self, conservar: np.ndarray, embeddings: np.ndarray) -> None:
+        """
+        Quita del grafo los nodos de las filas no conservadas y renumera los
+        demás (como VectorStore.compactar), sin reconstruirlo: cada nodo que
+        enlazaba a uno quitado ocupa los huecos con los vecinos de este más
+        parecidos a él, para que el grafo siga conectado.
+
+        Args:
+            conservar: Máscara (n,) de las filas que se conservan
+            embeddings: Matriz del almacén ya compactada (numeración nueva)
+        """
+        n = self._n
+        mapa = np.full(n + 1, -1, dtype=np.int64)  # Posición n: huecos
+        mapa[:n][conservar] = np.arange(int(np.count_nonzero(conservar)))
+        vecinos_nuevos: List[np.ndarray] = []
+        filas_nuevas: List[Dict[int, int]] = []
+        for nivel, vecinos in enumerate(self._vecinos):
+            if nivel == 0:
+                nodos = np.arange(n)
+                posicion = nodos
+            else:
+                nodos = np.fromiter(self._filas[nivel].keys(), dtype=np.int64)
+                posicion = np.full(n, -1, dtype=np.int64)
+                posicion[nodos] = np.fromiter(self._filas[nivel].values(), dtype=np.int64)
+            antiguos = vecinos[posicion[nodos]]
+            antiguos = np.where(antiguos < 0, n, antiguos)
+            renumerados = mapa[antiguos]
+            quitados = (antiguos < n) & (renumerados < 0)
+            vivos = mapa[nodos] >= 0
+            for i in np.flatnonzero(vivos & quitados.any(axis=1)).tolist():
+                propios = renumerados[i][renumerados[i] >= 0]
+                libres = self._maximo(nivel) - len(propios)
+                candidatos = mapa[vecinos[posicion[antiguos[i][quitados[i]]]]].ravel()
+                candidatos = np.setdiff1d(candidatos[candidatos >= 0], np.append(propios, mapa[nodos[i]]))
+                if libres and len(candidatos):
+                    sims = self._vectores(embeddings, candidatos) @ self._vectores(embeddings, mapa[nodos[i]])
+                    propios = np.concatenate([propios, candidatos[np.argsort(-sims)[:libres]]])
+                renumerados[i] = -1
+                renumerados[i, :len(propios)] = propios
+            if not vivos.any():
+                break
+            vecinos_nuevos.append(renumerados[vivos])
+            filas_nuevas.append({} if nivel == 0 else
+                                {int(nodo): fila for fila, nodo in enumerate(mapa[nodos[vivos]].tolist())})
+
+        self._vecinos, self._filas = vecinos_nuevos, filas_nuevas
+        self._n = int(np.count_nonzero(conservar))
+        if not self._vecinos:
+            self._entrada = None
+        elif mapa[self._entrada] >= 0:
+            self._entrada = int(mapa[self._entrada])  # Sigue en el nivel más alto
+        else:
+            superior = len(self._vecinos) - 1
+            self._entrada = 0 if superior == 0 else next(iter(self._filas[superior]))
+
+    def buscar(self, embeddings: np.ndarray, consulta: np.ndarray, top_k: int,
+               ef_busqueda: Optional[int] = None,
+               vivas: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve las filas y similitudes de los top_k vecinos aproximados de la consulta.
+        Si se da la máscara 'vivas', las filas borradas se recorren pero no se devuelven.
+        """
+        if self._entrada is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ef = max(ef_busqueda or self.ef_busqueda, top_k)
+        consulta = np.asarray(consulta, dtype=np.float32)
+        entradas = np.array([self._entrada], dtype=np.int64)
+        for nivel in range(len(self._vecinos) - 1, 0, -1):
+            entradas = self._buscar_nivel(embeddings, consulta, entradas, 1, nivel)[0]
+        nodos, sims = self._buscar_nivel(embeddings, consulta, entradas, ef, 0)
+        if vivas is not None:
+            nodos, sims = nodos[vivas[nodos]], sims[vivas[nodos]]
+        return nodos[:top_k].astype(np.int64), sims[:top_k].astype(np.float32)
@@ -0,0 +1,141 @@
+# src/core/indice_ivf.py
+import numpy as np
+from typing import List, Optional
+
+from src.core.buffers import ampliar
+
+
+class IndiceIVF:
+    """
+    Índice aproximado de tipo IVF (inverted file).
+
+    Agrupa los vectores (ya normalizados) con k-means esférico en 'nlist'
+    particiones y guarda, para cada centroide, la lista de filas que le
+    pertenecen. En la búsqueda solo se visitan las 'nprobe' listas cuyos
+    centroides son más parecidos a la consulta.
+
+    Cada lista es un buffer que crece por duplicación: al agregar un lote solo
+    se añaden sus filas al final de sus listas, sin reordenar las anteriores
+    (las filas de cada lista quedan siempre en orden creciente).
+    """
+
+    TAM_BLOQUE = 65536        # Filas por bloque al asignar (acota la memoria)
+    MUESTRAS_POR_LISTA = 256  # Tamaño máximo de la muestra de entrenamiento por centroide
+    CAPACIDAD_MINIMA = 64     # Capacidad inicial de cada lista
+
+    def __init__(self, nlist: int = 100, nprobe: int = 8, iteraciones: int = 20, semilla: int = 0):
+        """
+        Args:
+            nlist: Número de particiones (centroides)
+            nprobe: Número de particiones a visitar por consulta
+            iteraciones: Iteraciones de k-means
+            semilla: Semilla para la inicialización
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iteraciones = iteraciones
+        self.semilla = semilla
+        self.centroides: Optional[np.ndarray] = None
+        self._n = 0                                           # Filas indexadas
+        self._listas = [np.empty(0, dtype=np.int64) for _ in range(nlist)]  # Filas de cada partición
+        self._tamanos = np.zeros(nlist, dtype=np.int64)       # Filas ocupadas de cada lista
+
+    def __setstate__(self, estado: dict) -> None:
+        # Índices guardados con el formato anterior: filas ordenadas por partición + desplazamientos
+        orden, inicios = estado.pop("_orden", None), estado.pop("_inicios", None)
+        asignaciones = estado.pop("_asignaciones", None)
+        self.__dict__.update(estado)
+        if orden is not None:
+            self._n = len(asignaciones)
+            self._listas = [orden[inicios[p]:inicios[p + 1]].copy() for p in range(self.nlist)]
+            self._tamanos = np.diff(inicios).astype(np.int64)
+
+    @property
+    def entrenado(self) -> bool:
+        return self.centroides is not None
+
+    def _asignar(self, vectores: np.ndarray) -> np.ndarray:
+        """Devuelve el centroide más cercano de cada vector, procesando por bloques."""
+        asignaciones = np.empty(len(vectores), dtype=np.int32)
+        for inicio in range(0, len(vectores), self.TAM_BLOQUE):
+            bloque = vectores[inicio:inicio + self.TAM_BLOQUE]
+            asignaciones[inicio:inicio + len(bloque)] = np.argmax(bloque @ self.centroides.T, axis=1)
+        return asignaciones
+
+    def entrenar(self, vectores: np.ndarray) -> None:
+        """
+        Entrena los centroides con k-means esférico sobre (una muestra de) los vectores.
+
+        Raises:
+            ValueError: Si hay menos vectores que particiones
+        """
+        if len(vectores) < self.nlist:
+            raise ValueError(f"Se necesitan al menos {self.nlist} vectores para entrenar el IVF")
+
+        rng = np.random.default_rng(self.semilla)
+        max_muestras = self.nlist * self.MUESTRAS_POR_LISTA
+        if len(vectores) > max_muestras:
+            muestra = vectores[np.sort(rng.choice(len(vectores), max_muestras, replace=False))]
+        else:
+            muestra = vectores
+        # Los centroides se calculan en float32 aunque el almacén sea float16
+        muestra = np.asarray(muestra, dtype=np.float32)
+
+        self.centroides = muestra[rng.choice(len(muestra), self.nlist, replace=False)].copy()
+        for _ in range(self.iteraciones):
+            asignaciones = self._asignar(muestra)
+            sumas = np.zeros_like(self.centroides)
+            np.add.at(sumas, asignaciones, muestra)
+            conteos = np.bincount(asignaciones, minlength=self.nlist)
+            # Las particiones vacías se reinician con puntos aleatorios
+            vacias = np.flatnonzero(conteos == 0)
+            if len(vacias):
+                sumas[vacias] = muestra[rng.choice(len(muestra), len(vacias), replace=False)]
+            normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+            normas[normas == 0] = 1.0
+            self.centroides = (sumas / normas).astype(np.float32)
+
+    def agregar(self, vectores: np.ndarray) -> None:
+        """
+        Asigna nuevas filas (que se numeran a continuación de las existentes) a sus particiones.
+        """
+        if not self.entrenado:
+            raise ValueError("El índice IVF debe entrenarse antes de agregar vectores")
+        asignaciones = self._asignar(vectores)
+        # Solo se ordena el lote nuevo; cada tramo se añade al final de su lista
+        orden = np.argsort(asignaciones, kind="stable")
+        conteos = np.bincount(asignaciones, minlength=self.nlist)
+        inicios = np.concatenate([[0], np.cumsum(conteos)])
+        for particion in np.flatnonzero(conteos):
+            ocupadas, nuevas = self._tamanos[particion], conteos[particion]
+            lista = ampliar(self._listas[particion], ocupadas, ocupadas + nuevas, self.CAPACIDAD_MINIMA)
+            lista[ocupadas:ocupadas + nuevas] = self._n + orden[inicios[particion]:inicios[particion + 1]]
+            self._listas[particion] = lista
+            self._tamanos[particion] += nuevas
+        self._n += len(vectores)
+
+    def filtrar(self, conservar: np.ndarray) -> None:
+        """
+        Elimina filas del índice tras compactar el almacén. 'conservar' es la
+        máscara booleana de filas que siguen; las demás se renumeran en orden.
+        """
+        nuevas = np.cumsum(conservar) - 1  # Número nuevo de cada fila conservada
+        for particion in range(self.nlist):
+            filas = self.lista(particion)
+            filas = nuevas[filas[conservar[filas]]]
+            self._listas[particion] = filas
+            self._tamanos[particion] = len(filas)
+        self._n = int(np.count_nonzero(conservar))
+
+    def lista(self, particion: int) -> np.ndarray:
+        """Filas que pertenecen a una partición."""
+        return self._listas[particion][:self._tamanos[particion]]
+
+    def candidatos(self, consultas: np.ndarray, nprobe: Optional[int] = None) -> List[np.ndarray]:
+        """
+        Devuelve, para cada consulta, las filas de las 'nprobe' particiones más cercanas.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        similitudes = consultas @ self.centroides.T
+        mejores = np.argpartition(similitudes, -nprobe, axis=1)[:, -nprobe:]
+        return [np.concatenate([self.lista(p) for p in fila]) for fila in mejores]
@@ -0,0 +1,143 @@
+# src/core/instantaneas.py
+import os
+import re
+import shutil
+import threading
+from typing import Callable, List, Optional
+
+from src.core.vector_store import VectorStore
+
+ACTUAL = "CURRENT"  # Archivo con el nombre de la instantánea en uso
+_NOMBRE = re.compile(r"^v(\d{6})$")
+_BORRADA = re.compile(r"^\.borrar-v\d{6}$")  # Instantánea retirada pendiente de borrar
+
+
+def listar_instantaneas(raiz: str) -> List[str]:
+    """Nombres de las instantáneas completas de 'raiz', de la más antigua a la más nueva."""
+    if not os.path.isdir(raiz):
+        return []
+    return sorted(n for n in os.listdir(raiz) if _NOMBRE.match(n))
+
+
+def instantanea_actual(raiz: str) -> Optional[str]:
+    """Ruta de la instantánea a la que apunta CURRENT, o None si aún no hay ninguna."""
+    try:
+        with open(os.path.join(raiz, ACTUAL), "r", encoding="utf-8") as f:
+            nombre = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(raiz, nombre) if nombre else None
+
+
+def publicar_instantanea(store: VectorStore, raiz: str, conservar: int = 3,
+                         tam_bloque_textos: Optional[int] = None) -> str:
+    """
+    Guarda el almacén como una instantánea nueva de 'raiz' (v000001,
+    v000002...) y apunta CURRENT a ella.
+
+    La instantánea se escribe en un directorio temporal que se renombra
+    cuando está completa, y CURRENT se sustituye con un renombrado atómico:
+    quien lea CURRENT ve siempre una instantánea entera, la anterior o la
+    nueva. Después se borran las instantáneas antiguas salvo las 'conservar'
+    más recientes (ver _podar); los procesos que aún tengan abierta alguna
+    siguen leyéndola (sus archivos abiertos o con mmap no desaparecen hasta
+    que los cierran).
+
+    Returns:
+        Ruta de la nueva instantánea
+    """
+    os.makedirs(raiz, exist_ok=True)
+    existentes = listar_instantaneas(raiz)
+    siguiente = int(_NOMBRE.match(existentes[-1]).group(1)) + 1 if existentes else 1
+    nombre = f"v{siguiente:06d}"
+    temporal = os.path.join(raiz, f".{nombre}.tmp")
+    if os.path.exists(temporal):
+        shutil.rmtree(temporal)
+    store.guardar(temporal, tam_bloque_textos)
+    os.rename(temporal, os.path.join(raiz, nombre))
+
+    ruta_actual = os.path.join(raiz, ACTUAL)
+    with open(ruta_actual + ".tmp", "w", encoding="utf-8") as f:
+        f.write(nombre)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ruta_actual + ".tmp", ruta_actual)
+
+    _podar(raiz, conservar)
+    return os.path.join(raiz, nombre)
+
+
+def _podar(raiz: str, conservar: int) -> None:
+    """
+    Borra las instantáneas antiguas salvo las 'conservar' más recientes.
+
+    Cada una se renombra antes a '.borrar-vNNNNNN', fuera de los nombres que
+    lista listar_instantaneas, y después se borra: si el borrado se queda a
+    medias (en Windows no se pueden borrar los archivos que otro proceso
+    tiene abiertos) no queda una instantánea incompleta a la vista, y el
+    resto se reintenta en la siguiente publicación. Si ni siquiera se puede
+    renombrar, la instantánea sigue entera y también se reintenta después.
+    """
+    for antigua in listar_instantaneas(raiz)[:-max(conservar, 1)]:
+        try:
+            os.rename(os.path.join(raiz, antigua), os.path.join(raiz, f".borrar-{antigua}"))
+        except OSError:
+            continue
+    for retirada in os.listdir(raiz):
+        if _BORRADA.match(retirada):
+            shutil.rmtree(os.path.join(raiz, retirada), ignore_errors=True)
+
+
+class VigilanteInstantaneas:
+    """
+    Comprueba periódicamente el CURRENT de un directorio de instantáneas y,
+    cuando cambia, carga la nueva instantánea y se la pasa a 'al_cambiar'.
+
+    La carga se hace en un hilo aparte (con mmap, así que es rápida) y el
+    cambio es solo sustituir una referencia: las búsquedas en curso terminan
+    con el almacén que ya tenían.
+    """
+
+    def __init__(self, raiz: str, al_cambiar: Callable[[VectorStore], None], intervalo: float = 2.0):
+        """
+        Args:
+            raiz: Directorio de instantáneas (ver publicar_instantanea)
+            al_cambiar: Función que recibe el VectorStore de cada instantánea nueva
+            intervalo: Segundos entre comprobaciones
+        """
+        self.raiz = raiz
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self.actual: Optional[str] = None  # Ruta de la instantánea cargada
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def comprobar(self) -> bool:
+        """Carga la instantánea actual si es distinta de la ya cargada. Devuelve si ha cambiado."""
+        ruta = instantanea_actual(self.raiz)
+        if ruta is None or ruta == self.actual:
+            return False
+        store = VectorStore.cargar(ruta)
+        self.actual = ruta
+        self.al_cambiar(store)
+        return True
+
+    def iniciar(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def _vigilar(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.comprobar()
+            except (OSError, ValueError) as e:
+                # Se sigue con el almacén anterior y se reintenta en la siguiente comprobación
+                print(f"[!] No se pudo cargar la instantánea de {self.raiz}: {e}")
@@ -0,0 +1,118 @@
+# src/core/memoria_compartida.py
+import json
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+VERSION = 1
+ALINEACION = 64  # Las matrices empiezan en múltiplos de 64 bytes
+
+
+def _alinear(posicion: int) -> int:
+    return -(-posicion // ALINEACION) * ALINEACION
+
+
+class MetadatosCompartidos:
+    """
+    Secuencia de solo lectura de metadatos guardados como JSON consecutivos en
+    un buffer compartido. Cada elemento se decodifica solo cuando se accede a
+    él, así que un proceso que adjunta el índice no materializa los metadatos
+    de todo el corpus, solo los de los resultados.
+    """
+
+    def __init__(self, buffer: memoryview, desplazamientos: np.ndarray):
+        self._buffer = buffer
+        self._desplazamientos = desplazamientos  # (n + 1,) int64
+
+    def __len__(self) -> int:
+        return len(self._desplazamientos) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        inicio, fin = self._desplazamientos[i], self._desplazamientos[i + 1]
+        return json.loads(bytes(self._buffer[inicio:fin]).decode("utf-8"))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def publicar(embeddings: np.ndarray, metadatos: List[Dict[str, Any]], vivas: np.ndarray,
+             rangos_documento: Dict[Any, List[List[int]]],
+             nombre: Optional[str] = None) -> shared_memory.SharedMemory:
+    """
+    Copia un almacén a un bloque de memoria compartida con este formato:
+
+        [longitud de la cabecera: uint64][cabecera JSON]
+        [embeddings (n, dim)][vivas (n,) bool][desplazamientos (n + 1,) int64][metadatos JSON]
+
+    La cabecera guarda la dimensión, el dtype, la posición de cada parte y el
+    índice documento -> rangos de filas. Devuelve el bloque; hay que
+    mantenerlo abierto mientras haya procesos que lo usen.
+    """
+    codificados = [json.dumps(m, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for m in metadatos]
+    desplazamientos = np.zeros(len(codificados) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in codificados], out=desplazamientos[1:])
+
+    cabecera = {
+        "version": VERSION,
+        "dim": embeddings.shape[1],
+        "dtype": embeddings.dtype.name,
+        "n": len(embeddings),
+        "rangos": [[doc, rangos] for doc, rangos in rangos_documento.items()],
+    }
+    # La cabecera incluye las posiciones, que dependen de su propio tamaño: se
+    # reserva espacio de sobra calculándolas con una cabecera provisional
+    provisional = len(json.dumps(cabecera).encode("utf-8")) + 256
+    pos_embeddings = _alinear(8 + provisional)
+    pos_vivas = _alinear(pos_embeddings + embeddings.nbytes)
+    pos_desplazamientos = _alinear(pos_vivas + len(embeddings))
+    pos_metadatos = pos_desplazamientos + desplazamientos.nbytes
+    cabecera["posiciones"] = [pos_embeddings, pos_vivas, pos_desplazamientos, pos_metadatos]
+    cabecera_bytes = json.dumps(cabecera).encode("utf-8")
+
+    total = pos_metadatos + int(desplazamientos[-1])
+    bloque = shared_memory.SharedMemory(name=nombre, create=True, size=max(total, 1))
+    buf = bloque.buf
+    struct.pack_into("<Q", buf, 0, len(cabecera_bytes))
+    buf[8:8 + len(cabecera_bytes)] = cabecera_bytes
+    np.ndarray(embeddings.shape, dtype=embeddings.dtype, buffer=buf, offset=pos_embeddings)[:] = embeddings
+    np.ndarray(len(embeddings), dtype=bool, buffer=buf, offset=pos_vivas)[:] = vivas
+    np.ndarray(len(desplazamientos), dtype=np.int64, buffer=buf, offset=pos_desplazamientos)[:] = desplazamientos
+    buf[pos_metadatos:total] = b"".join(codificados)
+    return bloque
+
+
+def adjuntar(nombre: str) -> Tuple[shared_memory.SharedMemory, Dict[str, Any], np.ndarray,
+                                   np.ndarray, MetadatosCompartidos]:
+    """
+    Abre un bloque creado con publicar() sin copiar nada. Devuelve el bloque,
+    la cabecera y vistas de solo lectura de embeddings, vivas y metadatos.
+    """
+    try:
+        bloque = shared_memory.SharedMemory(name=nombre, track=False)
+    except TypeError:
+        # Python < 3.13: el proceso que adjunta no debe registrar el bloque, o
+        # el resource_tracker lo borraría al terminar
+        registrar = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            bloque = shared_memory.SharedMemory(name=nombre)
+        finally:
+            resource_tracker.register = registrar
+
+    buf = bloque.buf
+    longitud, = struct.unpack_from("<Q", buf, 0)
+    cabecera = json.loads(bytes(buf[8:8 + longitud]).decode("utf-8"))
+    if cabecera["version"] > VERSION:
+        raise ValueError(f"Versión de memoria compartida {cabecera['version']} no soportada")
+    n, dim = cabecera["n"], cabecera["dim"]
+    pos_embeddings, pos_vivas, pos_desplazamientos, pos_metadatos = cabecera["posiciones"]
+
+    embeddings = np.ndarray((n, dim), dtype=cabecera["dtype"], buffer=buf, offset=pos_embeddings)
+    vivas = np.ndarray(n, dtype=bool, buffer=buf, offset=pos_vivas)
+    desplazamientos = np.ndarray(n + 1, dtype=np.int64, buffer=buf, offset=pos_desplazamientos)
+    for vista in (embeddings, vivas, desplazamientos):
+        vista.flags.writeable = False
+    metadatos = MetadatosCompartidos(buf[pos_metadatos:], desplazamientos)
+    return bloque, cabecera, embeddings, vivas, metadatos
@@ -0,0 +1,446 @@
+# src/core/metadatos.py
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from src.core.buffers import ampliar
+from src.core.chunking import unir_solapados
+
+_FALTA = object()
+
+
+class TextosEnDisco:
+    """
+    Textos de los chunks en un archivo (textos.bin) que se leen bajo demanda.
+
+    El archivo es la concatenación de los textos en UTF-8; si 'bloques' se
+    indica, está dividido en bloques de 'tam_bloque' bytes comprimidos con
+    zlib por separado y 'bloques' guarda dónde empieza cada uno. Los últimos
+    bloques descomprimidos se mantienen en una pequeña caché.
+    """
+
+    BLOQUES_EN_CACHE = 16
+
+    def __init__(self, ruta: str, tam_bloque: int = 0, bloques: Optional[np.ndarray] = None):
+        """
+        Args:
+            ruta: Archivo de textos
+            tam_bloque: Bytes (sin comprimir) por bloque; 0 si no está comprimido
+            bloques: Posición en el archivo de cada bloque comprimido (nbloques + 1)
+        """
+        self.ruta = ruta
+        self.tam_bloque = tam_bloque
+        self.bloques = bloques
+        self._archivo = open(ruta, "rb")
+        self._cerrojo = threading.RLock()
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+
+    def _leer_archivo(self, inicio: int, fin: int) -> bytes:
+        with self._cerrojo:
+            self._archivo.seek(inicio)
+            return self._archivo.read(fin - inicio)
+
+    def _bloque(self, b: int) -> bytes:
+        with self._cerrojo:
+            datos = self._cache.get(b)
+            if datos is None:
+                datos = zlib.decompress(self._leer_archivo(int(self.bloques[b]), int(self.bloques[b + 1])))
+                self._cache[b] = datos
+                if len(self._cache) > self.BLOQUES_EN_CACHE:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(b)
+            return datos
+
+    def leer(self, inicio: int, fin: int) -> bytes:
+        """Bytes [inicio, fin) del texto concatenado."""
+        if not self.tam_bloque:
+            return self._leer_archivo(inicio, fin)
+        primero, ultimo = inicio // self.tam_bloque, (fin - 1) // self.tam_bloque
+        datos = b"".join(self._bloque(b) for b in range(primero, ultimo + 1))
+        desplazamiento = primero * self.tam_bloque
+        return datos[inicio - desplazamiento:fin - desplazamiento]
+
+    def cerrar(self) -> None:
+        self._archivo.close()
+
+
+def escribir_textos(f: BinaryIO, trozos: Iterable[bytes], tam_bloque: int = 0) -> Optional[np.ndarray]:
+    """
+    Escribe el texto concatenado en 'f' con el formato de TextosEnDisco. Con
+    tam_bloque > 0 lo comprime por bloques y devuelve la posición de cada
+    bloque en el archivo; si no, devuelve None.
+    """
+    if not tam_bloque:
+        for trozo in trozos:
+            f.write(trozo)
+        return None
+    posiciones = [0]
+    pendiente = bytearray()
+    for trozo in trozos:
+        pendiente += trozo
+        while len(pendiente) >= tam_bloque:
+            posiciones.append(posiciones[-1] + f.write(zlib.compress(bytes(pendiente[:tam_bloque]))))
+            del pendiente[:tam_bloque]
+    if pendiente:
+        posiciones.append(posiciones[-1] + f.write(zlib.compress(bytes(pendiente))))
+    return np.array(posiciones, dtype=np.int64)
+
+
+def mapa_bytes(texto: str) -> np.ndarray:
+    """
+    Posición en bytes (UTF-8) de cada carácter de 'texto', con una entrada
+    final para len(texto): convierte spans en caracteres a spans en bytes.
+    """
+    puntos = np.frombuffer(texto.encode("utf-32-le"), dtype=np.uint32)
+    tamanos = 1 + (puntos >= 0x80).astype(np.int64) + (puntos >= 0x800) + (puntos >= 0x10000)
+    mapa = np.zeros(len(puntos) + 1, dtype=np.int64)
+    np.cumsum(tamanos, out=mapa[1:])
+    return mapa
+
+
+def _regiones(inicios: np.ndarray, longitudes: np.ndarray):
+    """
+    Agrupa los textos [inicio, inicio + longitud) que se solapan o tocan en
+    regiones disjuntas. Devuelve el inicio y fin de cada región y la posición
+    de cada texto si las regiones se escriben seguidas desde 0; así los
+    chunks que comparten texto lo siguen compartiendo tras reempaquetar.
+    """
+    if not len(inicios):
+        vacio = np.empty(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    orden = np.argsort(inicios, kind="stable")
+    ini = inicios[orden].astype(np.int64)
+    fin = ini + longitudes[orden]
+    maximo = np.maximum.accumulate(fin)
+    nueva = np.concatenate([[True], ini[1:] > maximo[:-1]])
+    region = np.cumsum(nueva) - 1
+    primeros = np.flatnonzero(nueva)
+    region_ini = ini[primeros]
+    region_fin = np.maximum.reduceat(fin, primeros)
+    tamanos = region_fin - region_ini
+    region_pos = np.cumsum(tamanos) - tamanos
+    nuevos = np.empty(len(inicios), dtype=np.int64)
+    nuevos[orden] = region_pos[region] + ini - region_ini[region]
+    return region_ini, region_fin, nuevos
+
+
+class MetadatosColumnares:
+    """
+    Metadatos de los chunks guardados por columnas en lugar de como una lista
+    de diccionarios.
+
+    - documento: id int32 en una tabla de nombres internados (cada nombre se guarda una vez)
+    - chunk_id: array int32
+    - texto: posición (int64) y longitud (int32) de cada texto en un espacio de
+      bytes UTF-8 cuya primera parte puede estar en disco (TextosEnDisco) y el
+      resto en un buffer contiguo en memoria
+    - inicio / fin: span en caracteres del chunk dentro del texto de su documento
+
+    Así millones de chunks son unos pocos arrays de numpy en lugar de
+    millones de objetos para el recolector de basura. Los diccionarios solo
+    se construyen al acceder a una fila (p. ej. para los top-k de una
+    búsqueda) y, si los textos están en disco, solo entonces se leen. Los
+    campos que no encajan en las columnas (otras claves o valores de otro
+    tipo) se guardan aparte solo para las filas que los tienen.
+
+    Los chunks dados como spans (inicio, fin) sobre el texto de su documento
+    apuntan a una única copia de ese texto, así que el solapamiento entre
+    chunks vecinos no se guarda dos veces.
+
+    Como la matriz del VectorStore, los arrays tienen capacidad sobrante y
+    las filas ya escritas no cambian.
+    """
+
+    CAPACIDAD_INICIAL = 1024
+    DOCUMENTO, CHUNK_ID, TEXTO, SPAN = 1, 2, 4, 8  # Bits de 'campos': qué columnas tiene cada fila
+    COLUMNAS = {  # atributo -> dtype de las columnas por fila
+        "_doc_ids": np.int32,
+        "_chunk_ids": np.int32,
+        "_campos": np.uint8,
+        "_inicios": np.int64,     # Posición del texto de cada fila
+        "_longitudes": np.int32,  # Bytes del texto de cada fila
+        "_span_inicios": np.int32,
+        "_span_fines": np.int32,
+    }
+
+    def __init__(self, textos_disco: Optional[TextosEnDisco] = None, tam_disco: int = 0):
+        """
+        Args:
+            textos_disco: Archivo con los textos de las filas ya guardadas
+            tam_disco: Bytes de texto en el archivo; los textos en memoria van a continuación
+        """
+        self.tabla_documentos: List[Any] = []   # id -> nombre del documento
+        self._id_documento: Dict[Any, int] = {}  # nombre -> id
+        for atributo, dtype in self.COLUMNAS.items():
+            setattr(self, atributo, np.empty(0, dtype=dtype))
+        self._texto = np.empty(0, dtype=np.uint8)       # Textos en memoria (con capacidad sobrante)
+        self._ocupado_texto = 0
+        self._textos_disco = textos_disco
+        self._tam_disco = tam_disco
+        self._extras: Dict[int, Dict[str, Any]] = {}    # fila -> campos fuera de las columnas
+        self._n = 0
+
+    @classmethod
+    def desde_lista(cls, metas: Iterable[Dict[str, Any]],
+                    textos: Optional[Dict[Any, str]] = None) -> 'MetadatosColumnares':
+        metadatos = cls()
+        metadatos.extend(list(metas), textos)
+        return metadatos
+
+    @classmethod
+    def desde_columnas(cls, tabla_documentos: List[Any], columnas: Dict[str, np.ndarray],
+                       extras: Dict[int, Dict[str, Any]], textos_disco: TextosEnDisco) -> 'MetadatosColumnares':
+        """
+        Reconstruye los metadatos guardados con columnas() cuyos textos están
+        en 'textos_disco'. 'columnas' tiene un array por cada entrada de
+        COLUMNAS (sin el guion bajo inicial).
+        """
+        fines = columnas["inicios"] + columnas["longitudes"]
+        metadatos = cls(textos_disco, int(fines.max()) if len(fines) else 0)
+        metadatos.tabla_documentos = list(tabla_documentos)
+        metadatos._id_documento = {d: i for i, d in enumerate(metadatos.tabla_documentos)}
+        for atributo, dtype in cls.COLUMNAS.items():
+            setattr(metadatos, atributo, np.asarray(columnas[atributo[1:]], dtype=dtype))
+        metadatos._extras = extras
+        metadatos._n = len(metadatos._doc_ids)
+        return metadatos
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _internar(self, documento: Any) -> int:
+        id_documento = self._id_documento.get(documento)
+        if id_documento is None:
+            id_documento = self._id_documento[documento] = len(self.tabla_documentos)
+            self.tabla_documentos.append(documento)
+        return id_documento
+
+    def extend(self, metas: List[Dict[str, Any]], textos: Optional[Dict[Any, str]] = None) -> None:
+        """
+        Añade los metadatos de un lote de filas.
+
+        Args:
+            metas: Metadatos de cada fila. Un chunk puede traer su 'texto' o
+                solo su span ('inicio', 'fin') sobre el texto de su documento
+            textos: Texto de cada documento al que se refieren los spans
+        """
+        textos = textos or {}
+        n = len(metas)
+        nuevas = {atributo: np.zeros(n, dtype=dtype) for atributo, dtype in self.COLUMNAS.items()}
+        nuevas["_doc_ids"][:] = -1
+        campos = nuevas["_campos"]
+        partes: List[bytes] = []
+        ocupado = 0
+        documentos: Dict[Any, Any] = {}  # documento -> (posición de su texto en 'partes', mapa_bytes)
+        extras = {}
+        for j, meta in enumerate(metas):
+            resto = dict(meta)
+            documento = resto.pop("documento", _FALTA)
+            if documento is None or isinstance(documento, str):
+                nuevas["_doc_ids"][j] = self._internar(documento)
+                campos[j] |= self.DOCUMENTO
+            elif documento is not _FALTA:
+                resto["documento"] = documento
+            chunk_id = resto.pop("chunk_id", _FALTA)
+            if isinstance(chunk_id, (int, np.integer)) and not isinstance(chunk_id, bool) \
+                    and -2**31 <= chunk_id < 2**31:
+                nuevas["_chunk_ids"][j] = chunk_id
+                campos[j] |= self.CHUNK_ID
+            elif chunk_id is not _FALTA:
+                resto["chunk_id"] = chunk_id
+            span = (resto.get("inicio"), resto.get("fin"))
+            if all(isinstance(p, (int, np.integer)) and not isinstance(p, bool) and 0 <= p < 2**31 for p in span):
+                del resto["inicio"], resto["fin"]
+                nuevas["_span_inicios"][j], nuevas["_span_fines"][j] = span
+                campos[j] |= self.SPAN
+            texto = resto.pop("texto", _FALTA)
+            if isinstance(texto, str):
+                codificado = texto.encode("utf-8")
+                nuevas["_inicios"][j] = ocupado
+                nuevas["_longitudes"][j] = len(codificado)
+                partes.append(codificado)
+                ocupado += len(codificado)
+                campos[j] |= self.TEXTO
+            else:
+                if texto is not _FALTA:
+                    resto["texto"] = texto
+                elif campos[j] & self.SPAN and documento in textos:
+                    # El texto del documento se guarda una vez y el chunk apunta a su span
+                    if documento not in documentos:
+                        codificado = textos[documento].encode("utf-8")
+                        documentos[documento] = (ocupado, mapa_bytes(textos[documento]))
+                        partes.append(codificado)
+                        ocupado += len(codificado)
+                    base, mapa = documentos[documento]
+                    nuevas["_inicios"][j] = base + mapa[span[0]]
+                    nuevas["_longitudes"][j] = mapa[span[1]] - mapa[span[0]]
+                    campos[j] |= self.TEXTO
+            if resto:
+                extras[self._n + j] = resto
+
+        nuevas["_inicios"] += self._tam_disco + self._ocupado_texto
+        inicio, fin = self._n, self._n + n
+        for atributo, columna in nuevas.items():
+            buffer = ampliar(getattr(self, atributo), inicio, fin, self.CAPACIDAD_INICIAL)
+            buffer[inicio:fin] = columna
+            setattr(self, atributo, buffer)
+        codificado = np.frombuffer(b"".join(partes), dtype=np.uint8)
+        ocupado = self._ocupado_texto
+        self._texto = ampliar(self._texto, ocupado, ocupado + len(codificado), self.CAPACIDAD_INICIAL)
+        self._texto[ocupado:ocupado + len(codificado)] = codificado
+        self._ocupado_texto = ocupado + len(codificado)
+        self._extras.update(extras)
+        self._n = fin
+
+    def documento(self, i: int) -> Any:
+        """Nombre del documento de una fila (None si no tiene)."""
+        id_documento = self._doc_ids[i]
+        return self.tabla_documentos[id_documento] if id_documento >= 0 else None
+
+    def _bytes_rango(self, inicio: int, fin: int) -> bytes:
+        """Bytes [inicio, fin) del espacio de textos (parte en disco y parte en memoria)."""
+        partes = []
+        if inicio < self._tam_disco:
+            partes.append(self._textos_disco.leer(inicio, min(fin, self._tam_disco)))
+        if fin > self._tam_disco:
+            partes.append(self._texto[max(inicio, self._tam_disco) - self._tam_disco:
+                                      fin - self._tam_disco].tobytes())
+        return b"".join(partes)
+
+    def texto(self, i: int) -> str:
+        inicio = int(self._inicios[i])
+        return self._bytes_rango(inicio, inicio + int(self._longitudes[i])).decode("utf-8")
+
+    def texto_contiguo(self, filas: Sequence[int]) -> str:
+        """
+        Texto de varias filas consecutivas de un documento sin repetir lo que
+        comparten. Si son spans del mismo texto (rangos solapados o separados
+        solo por los espacios entre ellos), se lee de una vez el rango que los
+        cubre; si no, se unen quitando las palabras solapadas.
+        """
+        filas = np.asarray(filas, dtype=np.int64)
+        inicios = self._inicios[filas]
+        fines = inicios + self._longitudes[filas]
+        huecos_chars = self._span_inicios[filas[1:]] - self._span_fines[filas[:-1]]
+        huecos_bytes = inicios[1:] - fines[:-1]
+        # Los huecos entre spans son espacios (1 byte); si se solapan, el siguiente empieza dentro del anterior
+        mismo_texto = np.where(huecos_chars >= 0, huecos_bytes == huecos_chars,
+                               (inicios[1:] >= inicios[:-1]) & (huecos_bytes < 0))
+        if np.all(self._campos[filas] & self.SPAN) and mismo_texto.all():
+            return self._bytes_rango(int(inicios[0]), int(fines.max())).decode("utf-8")
+        texto = self.texto(int(filas[0]))
+        for fila in filas[1:].tolist():
+            texto = unir_solapados(texto, self.texto(fila))
+        return texto
+
+    def id_documento(self, documento: Any) -> int:
+        """Id interno de un documento (-1 si no hay filas suyas)."""
+        return self._id_documento.get(documento, -1)
+
+    def claves_chunk(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Id de documento y chunk_id de cada fila (-1 donde la fila no los tiene)."""
+        campos = self._campos[:self._n]
+        doc_ids = np.where(campos & self.DOCUMENTO, self._doc_ids[:self._n], -1)
+        chunk_ids = np.where(campos & self.CHUNK_ID, self._chunk_ids[:self._n], -1)
+        return doc_ids, chunk_ids
+
+    def extras(self) -> Dict[int, Dict[str, Any]]:
+        """Campos fuera de las columnas, por fila (solo las filas que los tienen)."""
+        return self._extras
+
+    def actualizar_extra(self, fila: int, campos: Dict[str, Any]) -> None:
+        """
+        Cambia campos de una fila; se guardan como extras, que tienen prioridad
+        sobre las columnas. La entrada se sustituye (no se modifica) para no
+        alterar las instantáneas tomadas con vista().
+        """
+        self._extras[fila] = {**self._extras.get(fila, {}), **campos}
+
+    def nombres_documento(self, inicio: int = 0, fin: Optional[int] = None) -> List[Any]:
+        """Nombre del documento de cada fila del rango (None en las que no tienen)."""
+        ids = self._doc_ids[inicio:self._n if fin is None else fin]
+        tabla = self.tabla_documentos + [None]  # El id -1 toma el último elemento
+        return [tabla[i] for i in ids.tolist()]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        """Construye el diccionario de metadatos de una fila."""
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        campos = self._campos[i]
+        meta: Dict[str, Any] = {}
+        if campos & self.DOCUMENTO:
+            meta["documento"] = self.documento(i)
+        if campos & self.CHUNK_ID:
+            meta["chunk_id"] = int(self._chunk_ids[i])
+        if campos & self.TEXTO:
+            meta["texto"] = self.texto(i)
+        if campos & self.SPAN:
+            meta["inicio"] = int(self._span_inicios[i])
+            meta["fin"] = int(self._span_fines[i])
+        if i in self._extras:
+            meta.update(self._extras[i])
+        return meta
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._n):
+            yield self[i]
+
+    def columnas(self) -> Dict[str, Any]:
+        """
+        Todo lo necesario para guardar a disco: un array por columna (con los
+        textos ya reempaquetados), la tabla de documentos, los extras y
+        'trozos_texto', un iterador con los bytes que forman textos.bin.
+        """
+        region_ini, region_fin, nuevos = _regiones(self._inicios[:self._n], self._longitudes[:self._n])
+        columnas = {atributo[1:]: getattr(self, atributo)[:self._n] for atributo in self.COLUMNAS}
+        columnas["inicios"] = nuevos
+        columnas["tabla_documentos"] = list(self.tabla_documentos)
+        columnas["extras"] = dict(self._extras)
+        columnas["trozos_texto"] = (self._bytes_rango(int(i), int(f)) for i, f in zip(region_ini, region_fin))
+        return columnas
+
+    def vista(self) -> 'MetadatosColumnares':
+        """
+        Copia de las filas actuales que comparte los arrays (las filas ya
+        escritas no cambian), para tomar instantáneas sin copiar los textos.
+        """
+        columnas = {atributo: getattr(self, atributo)[:self._n] for atributo in self.COLUMNAS}
+        return self._con_columnas(columnas, self._texto[:self._ocupado_texto], dict(self._extras))
+
+    def filtrar(self, conservar: np.ndarray) -> 'MetadatosColumnares':
+        """
+        Devuelve los metadatos de las filas marcadas en la máscara 'conservar',
+        renumeradas en orden. Los textos en memoria se reempaquetan; los que
+        están en disco no se leen.
+        """
+        conservar = np.asarray(conservar, dtype=bool)
+        columnas = {atributo: getattr(self, atributo)[:self._n][conservar] for atributo in self.COLUMNAS}
+        inicios = columnas["_inicios"]
+        en_memoria = inicios >= self._tam_disco
+        region_ini, region_fin, nuevos = _regiones(inicios[en_memoria] - self._tam_disco,
+                                                   columnas["_longitudes"][en_memoria])
+        # Posición de cada byte conservado en el buffer original, sin bucles en Python
+        tamanos = region_fin - region_ini
+        posiciones = np.repeat(region_ini - (np.cumsum(tamanos) - tamanos), tamanos) + np.arange(tamanos.sum())
+        inicios[en_memoria] = self._tam_disco + nuevos
+        nuevas = np.cumsum(conservar) - 1
+        extras = {int(nuevas[i]): extra for i, extra in self._extras.items() if conservar[i]}
+        return self._con_columnas(columnas, self._texto[posiciones], extras)
+
+    def _con_columnas(self, columnas: Dict[str, np.ndarray], texto: np.ndarray,
+                      extras: Dict[int, Dict[str, Any]]) -> 'MetadatosColumnares':
+        metadatos = MetadatosColumnares(self._textos_disco, self._tam_disco)
+        metadatos.tabla_documentos = list(self.tabla_documentos)
+        metadatos._id_documento = dict(self._id_documento)
+        for atributo, columna in columnas.items():
+            setattr(metadatos, atributo, columna)
+        metadatos._texto = texto
+        metadatos._ocupado_texto = len(texto)
+        metadatos._extras = extras
+        metadatos._n = len(columnas["_doc_ids"])
+        return metadatos
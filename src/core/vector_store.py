@@ -1,123 +1,1394 @@
 # src/core/vector_store.py
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+from contextlib import contextmanager
+import os
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.bm25 import IndiceBM25, fusion_rrf
+from src.core.buffers import ampliar
+from src.core.diversidad import mmr
+from src.core.cuantizacion import CuantizadorEscalar, CuantizadorPQ
+from src.core.indice_documentos import IndiceDocumentos
+from src.core.indice_hnsw import IndiceHNSW
+from src.core.indice_ivf import IndiceIVF
+from src.core.metadatos import MetadatosColumnares, TextosEnDisco, escribir_textos
+from src.core import memoria_compartida
+from src.core.wal import ELIMINAR, RegistroWAL, leer_segmento, listar_segmentos
+
+FORMATO_VERSION = 4             # Versión del formato en disco de guardar()
+MANIFIESTO = "manifest.json"
+_GENERACION = re.compile(r"^gen-(\d{6})$")  # Subdirectorios con los datos de cada guardado
+# Archivos de datos que las versiones < 4 guardaban junto al manifiesto
+_ARCHIVOS_SIN_GENERACION = ("embeddings.npy", "codigos.npy", "textos.bin", "metadatos.npz",
+                            "documentos.json", "indices.pkl", "vivas.npy", "metadatos.json")
+
+
+@contextmanager
+def _escritura_atomica(ruta: str):
+    """Abre un temporal junto a 'ruta' y lo renombra sobre ella al cerrar sin errores."""
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    """
+    Normaliza (L2) cada fila de la matriz. Las filas nulas se dejan a cero.
+    """
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vectores / normas
+
 
 class VectorStore:
     """
     Almacén de vectores que permite guardar y buscar vectores usando similitud de coseno.
-    Utiliza scikit-learn para cálculos de similitud.
+
+    Los embeddings se guardan en una única matriz contigua (float32, o
+    float16 con dtype="float16" para ocupar la mitad) que se
+    reserva con capacidad sobrante y crece de forma amortizada (duplicando),
+    así que añadir un lote es una copia de memoria y las búsquedas trabajan
+    directamente sobre el buffer sin conversiones.
+
+    Los vectores se normalizan (L2) al insertarse, de modo que la similitud de
+    coseno de una búsqueda se reduce a un producto matriz-vector. El
+    recorrido exacto se hace por bloques de filas con una fusión continua de
+    los top-k, así que no materializa una matriz de similitudes del tamaño
+    del corpus. Con almacenamiento float16 cada bloque se convierte a float32
+    y los productos se acumulan en float32.
+
+    Opcionalmente los vectores pueden comprimirse (cuantización por producto o
+    escalar int8): la búsqueda recorre los códigos y, si se conservan los
+    vectores originales, vuelve a puntuar con ellos los mejores candidatos.
+    Con un índice IVF, solo se puntúan los códigos de las particiones
+    visitadas (IVF-PQ); el HNSW no se combina con la compresión.
+
+    Los metadatos se guardan por columnas (MetadatosColumnares) y los
+    diccionarios de resultado solo se construyen para los top-k.
+
+    Los documentos eliminados se marcan como borrados (tombstones) y se
+    excluyen de las búsquedas; compactar() recupera el espacio cuando la
+    fracción de filas borradas supera 'umbral_borradas'.
+
+    Un proceso puede publicar() el almacén en memoria compartida y otros
+    procesos adjuntarse a él (adjuntar()) en modo solo lectura sin copiarlo.
     """
+
+    CAPACIDAD_INICIAL = 1024
+    DTYPES = ("float32", "float16")
+    TAM_BLOQUE = 65536  # Filas por bloque en los recorridos exactos (acota la memoria)
+    MIN_FILAS_HILO = 16384  # Por debajo de estas filas por hilo no compensa paralelizar
     
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, dtype: str = "float32", hilos: int = 1):
         """
         Inicializa el almacén de vectores.
         
         Args:
             dim: Dimensión de los vectores a almacenar
+            dtype: Tipo de almacenamiento de los vectores ("float32" o "float16")
+            hilos: Hilos con los que se reparten los recorridos exactos
+            
+        Raises:
+            ValueError: Si el dtype no está soportado
         """
+        if str(dtype) not in self.DTYPES:
+            raise ValueError(f"dtype debe ser uno de {self.DTYPES}, no {dtype}")
         self.dim = dim
-        self.embeddings = []  # Lista de vectores de embeddings
-        self.metadatos = []   # Lista de metadatos correspondientes
+        self.dtype = np.dtype(dtype)
+        self.tam_bloque = self.TAM_BLOQUE
+        self.hilos = hilos
+        self._ejecutor: Optional[ThreadPoolExecutor] = None
+        self._hilos_ejecutor = 0                      # Hilos del pool actual
+        self._cerrojo_ejecutor = threading.Lock()     # Crea el pool y le envía tareas
+        self._matriz = np.empty((0, dim), dtype=self.dtype)  # Buffer con capacidad sobrante
+        self._n = 0           # Filas ocupadas del buffer
+        self.metadatos = MetadatosColumnares()  # Metadatos de cada fila, por columnas
+        self.ivf: Optional[IndiceIVF] = None    # Índice aproximado opcional (IVF)
+        self.hnsw: Optional[IndiceHNSW] = None  # Índice aproximado opcional (grafo HNSW)
+        self.bm25: Optional[IndiceBM25] = None  # Índice léxico opcional para la búsqueda híbrida
+        self.centroides: Optional[IndiceDocumentos] = None  # Centroides por documento (búsqueda en dos fases)
+        self.cuantizador = None  # CuantizadorPQ / CuantizadorEscalar si el almacén está comprimido
+        self._codigos: Optional[np.ndarray] = None         # Códigos comprimidos (con capacidad sobrante)
+        self.originales = True  # False si se descartaron los vectores originales al comprimir
+        self.reordenar = 0      # Factor de candidatos que se re-puntúan con los originales
+        self._wal: Optional[RegistroWAL] = None  # Log de persistencia incremental (activar_wal)
+        self._ruta_wal: Optional[str] = None
+        self._en_disco: Optional[Tuple[str, int]] = None  # (directorio, versión) del último cargar/guardar
+        self.umbral_compactacion = 64 * 2**20   # Bytes de log que disparan una compactación
+        self._cerrojo = threading.Lock()              # Serializa escrituras frente a instantáneas
+        self._cerrojo_compactacion = threading.Lock() # Una sola compactación a la vez
+        self._hilo_compactacion: Optional[threading.Thread] = None
+        self._rangos_documento: Dict[Any, List[List[int]]] = {}  # documento -> rangos de filas [inicio, fin)
+        self._vivas = np.empty(0, dtype=bool)   # False en las filas borradas (con capacidad sobrante)
+        self._n_borradas = 0
+        self.umbral_borradas = 0.25  # Fracción de filas borradas que dispara compactar()
+        self.tam_bloque_textos = 0   # Bytes por bloque zlib de textos.bin al guardar (0 = sin comprimir)
+        self._compartida = None      # Bloque de memoria compartida publicado o adjuntado
+        self.solo_lectura = False    # True en los almacenes adjuntados a memoria compartida
+        self.version = 0             # Aumenta con cada cambio que puede alterar los resultados
+        self._posiciones_chunk = None  # (versión, desplazamientos, filas) de _indice_chunks()
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Vista (sin copia) de las filas ocupadas de la matriz de embeddings."""
+        return self._matriz[:self._n]
+
+    @property
+    def codigos(self) -> Optional[np.ndarray]:
+        """Vista de los códigos comprimidos, si el almacén está comprimido."""
+        return None if self._codigos is None else self._codigos[:self._n]
+
+    def __len__(self) -> int:
+        """Número de vectores vivos (sin contar los borrados pendientes de compactar)."""
+        return self._n - self._n_borradas
+
+    def _comprobar_escritura(self) -> None:
+        if self.solo_lectura:
+            raise ValueError("El almacén está adjuntado a memoria compartida y es de solo lectura")
+
+    def _reservar(self, n_nuevos: int) -> None:
+        """
+        Garantiza capacidad para n_nuevos vectores más, duplicando el buffer si hace falta.
+        """
+        requerido = self._n + n_nuevos
+        if self.originales:
+            self._matriz = ampliar(self._matriz, self._n, requerido, self.CAPACIDAD_INICIAL)
+        if self._codigos is not None:
+            self._codigos = ampliar(self._codigos, self._n, requerido, self.CAPACIDAD_INICIAL)
+        self._vivas = ampliar(self._vivas, self._n, requerido, self.CAPACIDAD_INICIAL)
 
-    def agregar(self, embs: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+    def agregar(self, embs: np.ndarray, metas: List[Dict[str, Any]],
+                textos: Optional[Dict[str, str]] = None) -> None:
         """
         Añade nuevos embeddings y sus metadatos al almacén.
         
         Args:
             embs: Array de numpy con los embeddings (n, dim)
             metas: Lista de diccionarios con metadatos para cada embedding
+            textos: Texto de cada documento, para los chunks dados como span
+                ('inicio', 'fin') en lugar de con su 'texto'
             
         Raises:
             ValueError: Si el número de embeddings no coincide con el de metadatos
         """
+        embs = np.asarray(embs, dtype=np.float32)
+        if embs.ndim == 1:
+            embs = embs.reshape(1, -1)
         if len(embs) != len(metas):
             raise ValueError("El número de embeddings debe coincidir con el de metadatos")
-            
-        self.embeddings.extend(embs.tolist())
-        self.metadatos.extend(metas)
+        if embs.shape[1] != self.dim:
+            raise ValueError(f"Los embeddings deben tener dimensión {self.dim}, no {embs.shape[1]}")
+
+        self._comprobar_escritura()
+        n = len(embs)
+        embs = normalizar(embs)
+        with self._cerrojo:
+            # Con WAL activo, el lote se persiste antes de aplicarse en memoria
+            if self._wal is not None:
+                self._wal.escribir(embs, metas, textos)
+            self._reservar(n)
+            if self.originales:
+                self._matriz[self._n:self._n + n] = embs
+            if self._codigos is not None:
+                self._codigos[self._n:self._n + n] = self.cuantizador.codificar(embs)
+            if self.ivf is not None:
+                self.ivf.agregar(embs)
+            self._vivas[self._n:self._n + n] = True
+            self._n += n
+            self.metadatos.extend(metas, textos)
+            if self.bm25 is not None:
+                self.bm25.agregar([self.metadatos.texto(i) for i in range(self._n - n, self._n)])
+            if self.hnsw is not None:
+                self.hnsw.agregar(self.embeddings)
+            documentos = [self._documentos_meta(m) for m in metas]
+            if self.centroides is not None:
+                self.centroides.agregar(documentos, embs)
+            self._indexar_documentos(self._n - n, documentos)
+            self.version += 1
 
-    def buscar(self, consulta_emb: np.ndarray, top_k: int = 3) -> List[Dict[str, Any]]:
+        if self._wal is not None and self._wal.tamano_pendiente() > self.umbral_compactacion:
+            self.compactar_wal(en_segundo_plano=True)
+
+    def buscar(self, consulta_emb: np.ndarray, top_k: int = 3, **opciones) -> List[Dict[str, Any]]:
         """
         Busca los top_k elementos más similares a la consulta.
         
         Args:
             consulta_emb: Vector de consulta (dim,)
             top_k: Número de resultados a devolver
+            **opciones: Opciones de búsqueda (nprobe, ef_busqueda, reordenar, exacto, filtro,
+                hilos, top_documentos); ver buscar_filas
             
         Returns:
             Lista de diccionarios con los metadatos de los resultados más similares,
             ordenados por similitud (de mayor a menor). Cada diccionario incluye
             una clave 'score' con la puntuación de similitud.
         """
-        if not self.embeddings:
-            return []
+        return self.buscar_lote(np.asarray(consulta_emb).reshape(1, -1), top_k, **opciones)[0]
+
+    def buscar_lote(self, consultas_emb: np.ndarray, top_k: int = 3, **opciones) -> List[List[Dict[str, Any]]]:
+        """
+        Busca los top_k elementos más similares para varias consultas a la vez.
+
+        Todas las consultas se puntúan con un único producto de matrices
+        (consultas x corpus), mucho más rápido que buscarlas de una en una.
+        
+        Args:
+            consultas_emb: Matriz de consultas (q, dim)
+            top_k: Número de resultados a devolver por consulta
+            **opciones: Opciones de búsqueda; ver buscar_filas
             
-        # Convertir a array de numpy
-        embeddings_array = np.array(self.embeddings, dtype=np.float32)
-        consulta_array = np.array(consulta_emb, dtype=np.float32).reshape(1, -1)
+        Returns:
+            Una lista por consulta con el mismo formato que devuelve buscar().
+        """
+        return [self._resultados(indices, puntuaciones, opciones.get("filtro"))
+                for indices, puntuaciones in self.buscar_filas(consultas_emb, top_k, **opciones)]
+
+    def buscar_filas(self, consultas_emb: np.ndarray, top_k: int = 3, nprobe: Optional[int] = None,
+                     ef_busqueda: Optional[int] = None, reordenar: Optional[int] = None,
+                     exacto: bool = False,
+                     filtro: Optional[Dict[str, List[str]]] = None,
+                     hilos: Optional[int] = None,
+                     top_documentos: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Como buscar_lote, pero devuelve por consulta las filas y puntuaciones en
+        bruto (arrays numpy) sin construir los diccionarios de resultado.
+
+        Args:
+            consultas_emb: Matriz de consultas (q, dim)
+            top_k: Número de resultados por consulta
+            nprobe: Particiones a visitar si hay un índice IVF (por defecto, las del
+                índice); si el almacén está comprimido, se puntúan con los códigos (IVF-PQ)
+            ef_busqueda: Candidatos a explorar si hay un índice HNSW (por defecto, los del índice)
+            reordenar: Con compresión, se re-puntúan top_k*reordenar candidatos con los
+                vectores originales (0 = no re-puntuar; por defecto, self.reordenar)
+            exacto: Si es True, ignora los índices aproximados y la compresión y
+                recorre todos los vectores originales
+            filtro: Restringe la búsqueda a unos documentos, p. ej.
+                {"documento": ["tema1.pdf"]}. Solo se puntúan sus filas (con
+                los vectores originales o, si el almacén está comprimido, con
+                los códigos), sin pasar por los índices IVF/HNSW.
+            hilos: Hilos para los recorridos por fuerza bruta (por defecto, self.hilos)
+            top_documentos: Búsqueda en dos fases: solo se puntúan los chunks de
+                los top_documentos documentos cuyo centroide se parece más a la
+                consulta (entre los del filtro, si lo hay). Requiere construir_centroides()
+
+        Raises:
+            ValueError: Si se pide búsqueda exacta y no se conservan los vectores
+                originales, si el filtro usa un campo distinto de 'documento' o
+                si se pide top_documentos sin centroides
+        """
+        consultas = normalizar(np.asarray(consultas_emb, dtype=np.float32).reshape(-1, self.dim))
+        filas = None if filtro is None else self.filas_filtro(filtro)
+        if self._n == 0 or (filas is not None and len(filas) == 0):
+            vacio = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [vacio for _ in range(len(consultas))]
+        if top_documentos is not None:
+            return self._buscar_por_documentos(consultas, top_k, top_documentos, filtro,
+                                               exacto, reordenar, hilos)
+
+        if self.ivf is not None and filas is None and not exacto:
+            return self._buscar_ivf(consultas, top_k, nprobe, reordenar)
+        if self.cuantizador is not None and not exacto:
+            return self._buscar_comprimido(consultas, top_k, reordenar, filas, hilos)
+        if not self.originales:
+            raise ValueError("La búsqueda exacta requiere conservar los vectores originales")
+        if filas is not None:
+            return self._buscar_exacto(consultas, top_k, filas, hilos)
+
+        if self.hnsw is not None and not exacto:
+            vivas = self._vivas[:self._n] if self._n_borradas else None
+            return [self.hnsw.buscar(self.embeddings, consulta, top_k, ef_busqueda, vivas)
+                    for consulta in consultas]
+
+        return self._buscar_exacto(consultas, top_k, hilos=hilos)
+
+    def _buscar_ivf(self, consultas: np.ndarray, top_k: int, nprobe: Optional[int],
+                    reordenar: Optional[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Puntúa solo las filas de las 'nprobe' particiones más cercanas a cada
+        consulta: con los vectores originales o, si el almacén está comprimido,
+        con los códigos (IVF-PQ), re-puntuando después si procede.
+        """
+        candidatos = self.ivf.candidatos(consultas, nprobe)
+        if self._n_borradas:
+            candidatos = [filas[self._vivas[filas]] for filas in candidatos]
+        if self.cuantizador is not None:
+            return [self._buscar_comprimido(consulta[None], top_k, reordenar, filas, hilos=1)[0]
+                    for consulta, filas in zip(consultas, candidatos)]
+        return [self._top_k(self.embeddings[filas] @ consulta, top_k, filas)
+                for consulta, filas in zip(consultas, candidatos)]
+
+    def _buscar_exacto(self, consultas: np.ndarray, top_k: int, filas: Optional[np.ndarray] = None,
+                       hilos: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Recorrido exacto de todos los vectores (o solo de 'filas', si se indican).
+        """
+        # Con los vectores ya normalizados, el coseno es un producto escalar
+        return self._top_k_por_bloques(
+            consultas, top_k, lambda sel: self._similitudes(consultas, self.embeddings[sel]), filas, hilos)
+
+    def _buscar_por_documentos(self, consultas: np.ndarray, top_k: int, top_documentos: int,
+                               filtro: Optional[Dict[str, List[str]]], exacto: bool,
+                               reordenar: Optional[int],
+                               hilos: Optional[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Búsqueda en dos fases: para cada consulta se eligen los documentos
+        de centroide más parecido y se recorren solo sus filas (con los
+        códigos si el almacén está comprimido).
+        """
+        if self.centroides is None:
+            raise ValueError("La búsqueda por documentos necesita centroides; usa construir_centroides()")
+        comprimido = self.cuantizador is not None and not exacto
+        if not comprimido and not self.originales:
+            raise ValueError("La búsqueda exacta requiere conservar los vectores originales")
+        permitidos = None if filtro is None else filtro.get("documento", [])
+        if isinstance(permitidos, str):
+            permitidos = [permitidos]
+
+        resultados = []
+        for consulta in consultas:
+            documentos = self.centroides.cercanos(consulta, top_documentos, permitidos)
+            filas = self.filas_filtro({"documento": documentos})
+            if len(filas) == 0:
+                resultados.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            elif comprimido:
+                resultados.extend(self._buscar_comprimido(consulta[None], top_k, reordenar, filas, hilos))
+            else:
+                resultados.extend(self._buscar_exacto(consulta[None], top_k, filas, hilos))
+        return resultados
+
+    def _top_k_por_bloques(self, consultas: np.ndarray, top_k: int,
+                           puntuar: Callable[[Any], np.ndarray],
+                           filas: Optional[np.ndarray] = None,
+                           hilos: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Recorre el almacén (o 'filas') en bloques de 'tam_bloque' filas y
+        mantiene para cada consulta los top_k mejores vistos hasta el momento,
+        de modo que la memoria máxima es O(tam_bloque * q + top_k) sea cual sea
+        el tamaño del corpus.
+
+        Con varios hilos, las filas se reparten en fragmentos contiguos que se
+        recorren en paralelo (NumPy libera el GIL en los productos y las
+        selecciones) y los top_k de cada fragmento se fusionan al final.
+
+        Args:
+            consultas: Matriz de consultas (q, dim) normalizadas
+            top_k: Resultados por consulta
+            puntuar: Recibe un selector de filas (slice o array) y devuelve sus similitudes (q, b)
+            filas: Restringir el recorrido a estas filas
+            hilos: Hilos para el recorrido (por defecto, self.hilos)
+        """
+        total = self._n if filas is None else len(filas)
+        hilos = min(hilos or self.hilos, max(total // self.MIN_FILAS_HILO, 1))
+        if hilos <= 1:
+            mejores_filas, mejores_sims = self._top_k_rango(consultas, top_k, puntuar, filas, 0, total)
+        else:
+            tam = -(-total // hilos)
+            futuros = self._en_paralelo(hilos, [(self._top_k_rango, consultas, top_k, puntuar, filas,
+                                                 inicio, min(inicio + tam, total))
+                                                for inicio in range(0, total, tam)])
+            parciales = [f.result() for f in futuros]
+            # Fusión de los top_k de cada fragmento
+            mejores_filas = np.concatenate([p[0] for p in parciales], axis=1)
+            mejores_sims = np.concatenate([p[1] for p in parciales], axis=1)
+            if mejores_sims.shape[1] > top_k:
+                indices = np.argpartition(mejores_sims, -top_k, axis=1)[:, -top_k:]
+                mejores_sims = np.take_along_axis(mejores_sims, indices, axis=1)
+                mejores_filas = np.take_along_axis(mejores_filas, indices, axis=1)
+
+        # Ordenar por similitud (de mayor a menor)
+        orden = np.argsort(-mejores_sims, axis=1)
+        mejores_filas = np.take_along_axis(mejores_filas, orden, axis=1)
+        mejores_sims = np.take_along_axis(mejores_sims, orden, axis=1)
+        return [self._sin_borradas(f, p) for f, p in zip(mejores_filas, mejores_sims)]
+
+    def _top_k_rango(self, consultas: np.ndarray, top_k: int, puntuar: Callable[[Any], np.ndarray],
+                     filas: Optional[np.ndarray], desde: int, hasta: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recorrido secuencial por bloques de las posiciones [desde, hasta).
+        Devuelve las matrices (q, <=top_k) de filas y similitudes sin ordenar.
+        """
+        mejores_filas = np.empty((len(consultas), 0), dtype=np.int64)
+        mejores_sims = np.empty((len(consultas), 0), dtype=np.float32)
+        for inicio in range(desde, hasta, self.tam_bloque):
+            fin = min(inicio + self.tam_bloque, hasta)
+            if filas is None:
+                filas_bloque = np.arange(inicio, fin)
+                similitudes = puntuar(slice(inicio, fin))
+                if self._n_borradas:
+                    similitudes[:, ~self._vivas[inicio:fin]] = -np.inf
+            else:
+                filas_bloque = filas[inicio:fin]
+                similitudes = puntuar(filas_bloque)
+
+            # Top-k del bloque y fusión con los mejores acumulados
+            k = min(top_k, fin - inicio)
+            indices = np.argpartition(similitudes, -k, axis=1)[:, -k:]
+            mejores_sims = np.concatenate([mejores_sims, np.take_along_axis(similitudes, indices, axis=1)], axis=1)
+            mejores_filas = np.concatenate([mejores_filas, filas_bloque[indices]], axis=1)
+            if mejores_sims.shape[1] > top_k:
+                indices = np.argpartition(mejores_sims, -top_k, axis=1)[:, -top_k:]
+                mejores_sims = np.take_along_axis(mejores_sims, indices, axis=1)
+                mejores_filas = np.take_along_axis(mejores_filas, indices, axis=1)
+        return mejores_filas, mejores_sims
+
+    def _en_paralelo(self, hilos: int, tareas: List[tuple]) -> list:
+        """
+        Envía las tareas (función, *argumentos) al pool de hilos y devuelve sus futuros.
+
+        El pool se crea la primera vez con max(hilos, self.hilos) hilos y solo
+        se sustituye si se piden más; el anterior se cierra sin esperar (sus
+        tareas terminan igualmente). Crear el pool y enviarle las tareas se
+        hace bajo el mismo cerrojo, así nadie envía tareas a un pool cerrado.
+        """
+        with self._cerrojo_ejecutor:
+            if self._hilos_ejecutor < hilos:
+                anterior = self._ejecutor
+                self._hilos_ejecutor = max(hilos, self.hilos)
+                self._ejecutor = ThreadPoolExecutor(max_workers=self._hilos_ejecutor)
+                if anterior is not None:
+                    anterior.shutdown(wait=False)
+            return [self._ejecutor.submit(*tarea) for tarea in tareas]
+
+    @staticmethod
+    def _similitudes(consultas: np.ndarray, bloque: np.ndarray) -> np.ndarray:
+        """Productos escalares (q, b) acumulados en float32 aunque el bloque sea float16."""
+        if bloque.dtype != np.float32:
+            bloque = bloque.astype(np.float32)
+        return consultas @ bloque.T
+
+    @staticmethod
+    def _sin_borradas(indices: np.ndarray, puntuaciones: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Quita de un resultado las filas enmascaradas (puntuación -inf)."""
+        validas = np.isfinite(puntuaciones)
+        if validas.all():
+            return indices, puntuaciones
+        return indices[validas], puntuaciones[validas]
+
+    def _buscar_comprimido(self, consultas: np.ndarray, top_k: int, reordenar: Optional[int],
+                           filas: Optional[np.ndarray] = None,
+                           hilos: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Recorre por bloques los códigos comprimidos (todos o solo los de 'filas')
+        y, si procede, re-puntúa los mejores candidatos con los vectores originales.
+        """
+        reordenar = self.reordenar if reordenar is None else reordenar
+        reordenar = reordenar if self.originales else 0
+        candidatos = self._top_k_por_bloques(
+            consultas, top_k * max(reordenar, 1),
+            lambda sel: self.cuantizador.puntuar(self.codigos[sel], consultas), filas, hilos)
+        if not reordenar:
+            return candidatos
+        return [self._top_k(self.embeddings[filas_c] @ consulta, top_k, filas_c)
+                for consulta, (filas_c, _) in zip(consultas, candidatos)]
+
+    @staticmethod
+    def _top_k(similitudes: np.ndarray, top_k: int,
+               filas: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Selecciona las top_k mayores similitudes de un vector, ordenadas de mayor a menor.
+        Si se indican 'filas', las posiciones se traducen a esas filas del almacén.
+        """
+        top_k = min(top_k, len(similitudes))
+        if top_k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        indices = np.argpartition(similitudes, -top_k)[-top_k:]
+        indices = indices[np.argsort(-similitudes[indices])]
+        if filas is not None:
+            return filas[indices], similitudes[indices]
+        return indices, similitudes[indices]
+
+    @staticmethod
+    def _documentos_meta(meta: Dict[str, Any]) -> Any:
+        """
+        Documento de una fila o, si es un chunk duplicado en varios sitios
+        (con 'fuentes'), la tupla de todos sus documentos.
+        """
+        if "fuentes" in meta:
+            return tuple(dict.fromkeys(f.get("documento") for f in meta["fuentes"]))
+        return meta.get("documento")
+
+    def _documentos_filas(self) -> List[Any]:
+        """Documento (o documentos, ver _documentos_meta) de cada fila."""
+        documentos = self.metadatos.nombres_documento()
+        for fila, extra in self.metadatos.extras().items():
+            if "fuentes" in extra:
+                documentos[fila] = self._documentos_meta(extra)
+        return documentos
+
+    def _indexar_documentos(self, inicio: int, documentos: List[Any]) -> None:
+        """
+        Actualiza el índice documento -> rangos de filas con los documentos
+        de las filas a partir de 'inicio' (una tupla si la fila pertenece a
+        varios). Los chunks de un documento suelen insertarse seguidos, así
+        que cada documento queda en uno o pocos rangos [inicio, fin).
+        """
+        for fila, documento in enumerate(documentos, start=inicio):
+            if not self._vivas[fila]:
+                continue
+            for nombre in documento if isinstance(documento, tuple) else (documento,):
+                rangos = self._rangos_documento.setdefault(nombre, [])
+                if rangos and rangos[-1][1] == fila:
+                    rangos[-1][1] = fila + 1
+                else:
+                    rangos.append([fila, fila + 1])
+
+    def eliminar_documento(self, nombre: str) -> int:
+        """
+        Elimina todos los chunks de un documento. Las filas solo se marcan
+        como borradas (coste proporcional a las filas del documento) y dejan
+        de aparecer en las búsquedas; si la fracción de borradas supera
+        'umbral_borradas', se compacta el almacén.
+
+        Los chunks duplicados que también pertenecen a otro documento aún
+        indexado (ver 'fuentes') no se borran: se quita este documento de sus
+        fuentes y pasan a mostrarse con la primera de las restantes.
+        
+        Args:
+            nombre: Valor de 'documento' en los metadatos
+            
+        Returns:
+            Número de filas eliminadas
+        """
+        self._comprobar_escritura()
+        with self._cerrojo:
+            rangos = self._rangos_documento.get(nombre)
+            if not rangos:
+                return 0
+            if self._wal is not None:
+                self._wal.escribir_eliminacion([nombre])
+            filas = self.filas_filtro({"documento": [nombre]})
+            del self._rangos_documento[nombre]
+            if self.centroides is not None:
+                self.centroides.eliminar(nombre)
+            extras = self.metadatos.extras()
+            compartidas = []
+            for fila in filas.tolist():
+                fuentes = extras.get(fila, {}).get("fuentes", ())
+                restantes = [f for f in fuentes if f.get("documento") != nombre]
+                if restantes:
+                    self.metadatos.actualizar_extra(fila, {"fuentes": restantes, **restantes[0]})
+                    compartidas.append(fila)
+            if compartidas:
+                filas = np.setdiff1d(filas, compartidas)
+            self._vivas[filas] = False
+            self._n_borradas += len(filas)
+            self.version += 1
+
+        if self._n_borradas > self.umbral_borradas * self._n:
+            self.compactar()
+        return len(filas)
+
+    def reemplazar_documento(self, nombre: str, embs: np.ndarray, metas: List[Dict[str, Any]],
+                             textos: Optional[Dict[str, str]] = None) -> None:
+        """
+        Sustituye los chunks de un documento (p. ej. porque el archivo ha
+        cambiado) sin reconstruir el resto del índice.
         
-        # Calcular similitud de coseno
-        similitudes = cosine_similarity(consulta_array, embeddings_array)[0]
+        Args:
+            nombre: Documento a reemplazar
+            embs: Embeddings de los nuevos chunks (n, dim)
+            metas: Metadatos de los nuevos chunks
+            textos: Texto del documento si los chunks vienen como spans (ver agregar)
+        """
+        self.eliminar_documento(nombre)
+        self.agregar(embs, metas, textos)
+
+    def compactar(self) -> None:
+        """
+        Elimina físicamente las filas borradas: reconstruye las matrices,
+        los metadatos y el índice de documentos y filtra el IVF y el grafo
+        HNSW (sin reconstruirlo: ver IndiceHNSW.filtrar). Bloquea las
+        escrituras mientras dura.
+        """
+        self._comprobar_escritura()
+        with self._cerrojo:
+            if not self._n_borradas:
+                return
+            conservar = self._vivas[:self._n].copy()
+            if self.originales:
+                self._matriz = self.embeddings[conservar]
+            if self._codigos is not None:
+                self._codigos = self.codigos[conservar]
+            self.metadatos = self.metadatos.filtrar(conservar)
+            if self.ivf is not None:
+                self.ivf.filtrar(conservar)
+            if self.bm25 is not None:
+                self.bm25.filtrar(conservar)
+            self._n = len(self.metadatos)
+            self._vivas = np.ones(self._n, dtype=bool)
+            self._n_borradas = 0
+            self._rangos_documento = {}
+            self._indexar_documentos(0, self._documentos_filas())
+            if self.hnsw is not None:
+                self.hnsw.filtrar(conservar, self.embeddings)
+            self.version += 1  # Las filas se renumeran
+
+    def documentos(self) -> List[str]:
+        """Nombres de los documentos indexados."""
+        return sorted(d for d in self._rangos_documento if d is not None)
+
+    def filas_filtro(self, filtro: Dict[str, List[str]]) -> np.ndarray:
+        """
+        Filas (ordenadas) que cumplen un filtro del tipo {"documento": [...]}.
+
+        Raises:
+            ValueError: Si el filtro usa un campo distinto de 'documento'
+        """
+        campos = set(filtro) - {"documento"}
+        if campos:
+            raise ValueError(f"Solo se puede filtrar por 'documento', no por {sorted(campos)}")
+        documentos = filtro.get("documento", [])
+        if isinstance(documentos, str):
+            documentos = [documentos]
+        rangos = [r for d in documentos for r in self._rangos_documento.get(d, [])]
+        if not rangos:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([np.arange(i, f, dtype=np.int64) for i, f in rangos]))
+
+    def construir_ivf(self, nlist: int = 100, nprobe: int = 8) -> IndiceIVF:
+        """
+        Entrena un índice IVF sobre los embeddings actuales. A partir de ahí
+        las búsquedas solo recorren las 'nprobe' particiones más cercanas a la
+        consulta y los vectores que se agreguen se asignan a su partición.
         
-        # Obtener los índices de los top_k más similares
-        indices = np.argpartition(similitudes, -top_k)[-top_k:]
+        Args:
+            nlist: Número de particiones (centroides de k-means)
+            nprobe: Particiones que se visitan por consulta
+
+        Raises:
+            ValueError: Si se descartaron los vectores originales al comprimir
+                o el almacén es de solo lectura
+        """
+        self._comprobar_escritura()
+        if not self.originales:
+            raise ValueError("Construir el índice IVF requiere conservar los vectores originales")
+        ivf = IndiceIVF(nlist=nlist, nprobe=nprobe)
+        ivf.entrenar(self.embeddings)
+        ivf.agregar(self.embeddings)
+        self.ivf = ivf
+        self.version += 1
+        return ivf
+
+    def construir_hnsw(self, M: int = 16, ef_construccion: int = 200, ef_busqueda: int = 64) -> IndiceHNSW:
+        """
+        Construye un grafo HNSW sobre los embeddings actuales. A partir de ahí
+        las búsquedas recorren el grafo en lugar de todo el corpus y los
+        vectores que se agreguen se insertan en él de forma incremental.
         
-        # Ordenar por similitud (de mayor a menor)
-        indices = indices[np.argsort(-similitudes[indices])]
+        Args:
+            M: Vecinos por nodo del grafo
+            ef_construccion: Candidatos explorados al insertar
+            ef_busqueda: Candidatos explorados al buscar
+
+        Raises:
+            ValueError: Si el almacén está comprimido o es de solo lectura
+        """
+        self._comprobar_escritura()
+        if self.cuantizador is not None:
+            raise ValueError("La compresión no se puede combinar con un índice HNSW; usa IVF (IVF-PQ)")
+        hnsw = IndiceHNSW(M=M, ef_construccion=ef_construccion, ef_busqueda=ef_busqueda)
+        hnsw.agregar(self.embeddings)
+        self.hnsw = hnsw
+        self.version += 1
+        return hnsw
+
+    def construir_bm25(self, k1: float = 1.2, b: float = 0.75) -> IndiceBM25:
+        """
+        Construye un índice léxico BM25 sobre los textos de los chunks para la
+        búsqueda híbrida (buscar_hibrido). Los vectores que se agreguen
+        después se indexan en él de forma incremental.
         
-        # Devolver los metadatos de los más similares con su puntuación
+        Args:
+            k1: Saturación de la frecuencia de los términos
+            b: Peso de la normalización por longitud del chunk
+
+        Raises:
+            ValueError: Si el almacén es de solo lectura (adjuntado)
+        """
+        self._comprobar_escritura()
+        bm25 = IndiceBM25(k1=k1, b=b)
+        bm25.agregar([self.metadatos.texto(i) for i in range(self._n)])
+        self.bm25 = bm25
+        self.version += 1
+        return bm25
+
+    def construir_centroides(self) -> IndiceDocumentos:
+        """
+        Calcula el centroide de cada documento para la búsqueda en dos fases
+        (buscar_filas con top_documentos). Los chunks que se agreguen o
+        eliminen después lo actualizan de forma incremental.
+
+        Raises:
+            ValueError: Si el almacén es de solo lectura (adjuntado)
+        """
+        self._comprobar_escritura()
+        centroides = IndiceDocumentos(self.dim)
+        documentos = self._documentos_filas()
+        vivas = np.flatnonzero(self._vivas[:self._n])
+        for inicio in range(0, len(vivas), self.tam_bloque):
+            filas = vivas[inicio:inicio + self.tam_bloque]
+            centroides.agregar([documentos[f] for f in filas.tolist()], self.vectores(filas))
+        self.centroides = centroides
+        self.version += 1
+        return centroides
+
+    def buscar_hibrido(self, consulta_emb: np.ndarray, consulta: str, top_k: int = 3,
+                       profundidad: Optional[int] = None, k_rrf: int = 60,
+                       **opciones) -> List[Dict[str, Any]]:
+        """
+        Búsqueda híbrida: combina la búsqueda por vectores con la léxica (BM25)
+        mediante fusión por rango recíproco, de modo que también aparecen los
+        chunks que contienen los términos exactos de la consulta (nombres de
+        fórmulas, códigos de asignatura...) aunque su embedding no esté entre
+        los más parecidos.
+        
+        Args:
+            consulta_emb: Vector de consulta (dim,)
+            consulta: Texto de la consulta
+            top_k: Número de resultados a devolver
+            profundidad: Resultados de cada búsqueda que entran en la fusión (por defecto, 5*top_k)
+            k_rrf: Constante de la fusión por rango recíproco
+            **opciones: Opciones de la búsqueda por vectores; ver buscar_filas
+            
+        Returns:
+            Lista con el formato de buscar(); 'score' es la puntuación fusionada
+            
+        Raises:
+            ValueError: Si no se ha construido el índice BM25
+        """
+        return self._resultados(*self._filas_hibridas(consulta_emb, consulta, top_k, profundidad,
+                                                      k_rrf, **opciones), opciones.get("filtro"))
+
+    def _filas_hibridas(self, consulta_emb: np.ndarray, consulta: str, top_k: int,
+                        profundidad: Optional[int] = None, k_rrf: int = 60,
+                        **opciones) -> Tuple[np.ndarray, np.ndarray]:
+        """Filas y puntuaciones fusionadas de buscar_hibrido."""
+        if self.bm25 is None:
+            raise ValueError("La búsqueda híbrida necesita un índice BM25; usa construir_bm25()")
+        profundidad = profundidad or 5 * top_k
+        densas, _ = self.buscar_filas(np.asarray(consulta_emb).reshape(1, -1), profundidad, **opciones)[0]
+        validas = self._vivas[:self._n]
+        if opciones.get("filtro") is not None:
+            en_filtro = np.zeros(self._n, dtype=bool)
+            en_filtro[self.filas_filtro(opciones["filtro"])] = True
+            validas = validas & en_filtro
+        lexicas, _ = self.bm25.buscar(consulta, profundidad, validas)
+        return fusion_rrf([densas, lexicas], top_k, k_rrf)
+
+    def buscar_diverso(self, consulta_emb: np.ndarray, top_k: int = 3, lambda_mmr: float = 0.5,
+                       candidatos: Optional[int] = None, consulta: Optional[str] = None,
+                       **opciones) -> List[Dict[str, Any]]:
+        """
+        Busca un conjunto de candidatos y elige entre ellos top_k resultados
+        relevantes pero distintos entre sí (relevancia marginal máxima), para
+        no devolver varios chunks vecinos casi iguales.
+        
+        Args:
+            consulta_emb: Vector de consulta (dim,)
+            top_k: Número de resultados a devolver
+            lambda_mmr: 1 = solo relevancia, 0 = solo diversidad
+            candidatos: Tamaño del conjunto de candidatos (por defecto, 4*top_k)
+            consulta: Texto de la consulta; si se da y hay índice BM25, los
+                candidatos salen de la búsqueda híbrida
+            **opciones: Opciones de búsqueda; ver buscar_filas
+            
+        Returns:
+            Lista con el formato de buscar(), en orden de selección; 'score' es
+            la puntuación del candidato en la búsqueda inicial
+        """
+        candidatos = max(candidatos or 4 * top_k, top_k)
+        if consulta is not None and self.bm25 is not None:
+            filas, puntuaciones = self._filas_hibridas(consulta_emb, consulta, candidatos, **opciones)
+        else:
+            filas, puntuaciones = self.buscar_filas(
+                np.asarray(consulta_emb).reshape(1, -1), candidatos, **opciones)[0]
+        consulta_n = normalizar(np.asarray(consulta_emb, dtype=np.float32).reshape(1, -1))[0]
+        elegidos = mmr(consulta_n, self.vectores(filas), top_k, lambda_mmr)
+        return self._resultados(filas[elegidos], puntuaciones[elegidos], opciones.get("filtro"))
+
+    def vectores(self, filas: np.ndarray) -> np.ndarray:
+        """
+        Vectores normalizados (float32) de unas filas: los originales o, si no
+        se conservan, la reconstrucción a partir de los códigos comprimidos.
+        """
+        if self.originales:
+            return np.asarray(self.embeddings[filas], dtype=np.float32)
+        return normalizar(self.cuantizador.reconstruir(self.codigos[filas]))
+
+    def comprimir_pq(self, m: int = 48, reordenar: int = 0,
+                     conservar_originales: bool = False) -> CuantizadorPQ:
+        """
+        Comprime los vectores con cuantización por producto: cada vector pasa
+        a ocupar 'm' bytes. Las búsquedas usan distancia asimétrica sobre los
+        códigos y los vectores que se agreguen se codifican al insertarse.
+        
+        Args:
+            m: Subespacios (bytes por vector); debe dividir a la dimensión
+            reordenar: Si es > 0, se re-puntúan top_k*reordenar candidatos con
+                los vectores originales (requiere conservarlos)
+            conservar_originales: Mantener también la matriz float32
+            
+        Raises:
+            ValueError: Si hay un índice HNSW o el almacén es de solo lectura
+        """
+        self._comprobar_escritura()
+        cuantizador = CuantizadorPQ(self.dim, m=m)
+        cuantizador.entrenar(self.embeddings)
+        self._comprimir(cuantizador, reordenar, conservar_originales)
+        return cuantizador
+
+    def comprimir_int8(self, reordenar: int = CuantizadorEscalar.REORDENAR,
+                       conservar_originales: bool = True) -> CuantizadorEscalar:
+        """
+        Comprime los vectores con cuantización escalar int8 (1 byte por
+        dimensión). El primer pase de la búsqueda es un producto entero sobre
+        los códigos y después se re-puntúan top_k*reordenar candidatos en float32.
+        
+        Args:
+            reordenar: Factor de candidatos que se re-puntúan (0 = solo int8)
+            conservar_originales: Mantener también la matriz float32 (necesario para re-puntuar)
+            
+        Raises:
+            ValueError: Si hay un índice HNSW o el almacén es de solo lectura
+        """
+        self._comprobar_escritura()
+        cuantizador = CuantizadorEscalar(self.dim)
+        cuantizador.entrenar(self.embeddings)
+        self._comprimir(cuantizador, reordenar, conservar_originales)
+        return cuantizador
+
+    def _comprimir(self, cuantizador, reordenar: int, conservar_originales: bool) -> None:
+        """Codifica los vectores actuales y, si se pide, libera la matriz float32."""
+        # El grafo HNSW se recorre con los vectores originales: comprimir no ahorraría nada
+        if self.hnsw is not None:
+            raise ValueError("La compresión no se puede combinar con un índice HNSW; usa IVF (IVF-PQ)")
+        codigos = cuantizador.codificar(self.embeddings)
+        self._codigos = ampliar(codigos, self._n, self._n, self.CAPACIDAD_INICIAL)
+        self.cuantizador = cuantizador
+        self.reordenar = reordenar
+        if not conservar_originales:
+            self._matriz = np.empty((0, self.dim), dtype=self.dtype)
+            self.originales = False
+        self.version += 1
+
+    def _indice_chunks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Índice posicional (id de documento, chunk_id) -> fila: la fila del
+        chunk c del documento d es filas[desplazamientos[d] + c] (-1 si no
+        existe). Se reconstruye, en un par de pasadas vectorizadas, solo
+        cuando el almacén ha cambiado. No incluye las filas borradas ni las
+        compartidas por varios documentos ('fuentes'), que no tienen vecinos
+        propios.
+        """
+        if self._posiciones_chunk is not None and self._posiciones_chunk[0] == self.version:
+            return self._posiciones_chunk[1:]
+        doc_ids, chunk_ids = self.metadatos.claves_chunk()
+        validas = self._vivas[:self._n] & (doc_ids >= 0) & (chunk_ids >= 0)
+        compartidas = [f for f, extra in self.metadatos.extras().items() if "fuentes" in extra]
+        validas[compartidas] = False
+        filas_validas = np.flatnonzero(validas)
+        doc_ids, chunk_ids = doc_ids[filas_validas], chunk_ids[filas_validas].astype(np.int64)
+
+        maximos = np.full(len(self.metadatos.tabla_documentos), -1, dtype=np.int64)
+        np.maximum.at(maximos, doc_ids, chunk_ids)
+        desplazamientos = np.zeros(len(maximos) + 1, dtype=np.int64)
+        np.cumsum(maximos + 1, out=desplazamientos[1:])
+        filas = np.full(int(desplazamientos[-1]), -1, dtype=np.int64)
+        filas[desplazamientos[doc_ids] + chunk_ids] = filas_validas
+        self._posiciones_chunk = (self.version, desplazamientos, filas)
+        return desplazamientos, filas
+
+    def expandir(self, resultados: List[Dict[str, Any]], n: int = 1) -> List[Dict[str, Any]]:
+        """
+        Amplía cada resultado con sus n chunks vecinos del mismo documento
+        (chunk_id - n ... chunk_id + n, los que existan): su 'texto' pasa a ser
+        el de todos ellos unido sin repetir el solapamiento y 'chunks_contexto'
+        lista los chunk_id incluidos. Los resultados del mismo documento cuyas
+        ventanas se tocan se funden en uno (en la posición del mejor), así que
+        pueden salir menos resultados que los recibidos.
+
+        Los vecinos se localizan con el índice posicional de _indice_chunks,
+        sin recorrer los metadatos. Los resultados sin documento o chunk_id y
+        los chunks compartidos ('fuentes') se devuelven sin ampliar.
+
+        Args:
+            resultados: Resultados de buscar() (o de las otras búsquedas)
+            n: Chunks vecinos a cada lado
+
+        Raises:
+            ValueError: En almacenes adjuntados a memoria compartida
+        """
+        if self.solo_lectura:
+            raise ValueError("La ampliación con vecinos no está disponible en un almacén adjuntado")
+        desplazamientos, filas = self._indice_chunks()
+
+        def fila(id_doc: int, chunk: int) -> int:
+            if 0 <= chunk < desplazamientos[id_doc + 1] - desplazamientos[id_doc]:
+                return int(filas[desplazamientos[id_doc] + chunk])
+            return -1
+
+        salida: List[Optional[Dict[str, Any]]] = []
+        ventanas: Dict[int, List[Tuple[int, int, int]]] = {}  # id de documento -> [(desde, hasta, posición en salida)]
+        for resultado in resultados:
+            id_doc = self.metadatos.id_documento(resultado.get("documento"))
+            chunk = resultado.get("chunk_id")
+            if "fuentes" not in resultado and chunk is not None and id_doc >= 0 and fila(id_doc, chunk) >= 0:
+                desde = hasta = chunk
+                while chunk - desde < n and fila(id_doc, desde - 1) >= 0:
+                    desde -= 1
+                while hasta - chunk < n and fila(id_doc, hasta + 1) >= 0:
+                    hasta += 1
+                ventanas.setdefault(id_doc, []).append((desde, hasta, len(salida)))
+            salida.append(resultado)
+
+        # Por documento, las ventanas ordenadas por su inicio se funden en una
+        # pasada con la anterior si se solapan o se tocan; cada fusión queda en
+        # la posición del mejor resultado (la menor) y las demás se vacían
+        for id_doc, lista in ventanas.items():
+            fundidas: List[List[int]] = []
+            for desde, hasta, posicion in sorted(lista):
+                if fundidas and desde <= fundidas[-1][1] + 1:
+                    ultima = fundidas[-1]
+                    ultima[1] = max(ultima[1], hasta)
+                    salida[max(ultima[2], posicion)] = None
+                    ultima[2] = min(ultima[2], posicion)
+                else:
+                    fundidas.append([desde, hasta, posicion])
+            for desde, hasta, posicion in fundidas:
+                chunks = list(range(desde, hasta + 1))
+                salida[posicion] = {**resultados[posicion],
+                                    "texto": self.metadatos.texto_contiguo([fila(id_doc, c) for c in chunks]),
+                                    "chunks_contexto": chunks}
+        return [r for r in salida if r is not None]
+
+    def _resultados(self, indices: np.ndarray, puntuaciones: np.ndarray,
+                    filtro: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Construye los diccionarios de resultado (metadatos + 'score') de unas filas.
+        Con un filtro, los chunks compartidos ('fuentes') se muestran con la
+        primera de sus fuentes que pertenece a los documentos filtrados.
+        """
+        permitidos = None if filtro is None else filtro.get("documento", [])
+        if isinstance(permitidos, str):
+            permitidos = [permitidos]
         resultados = []
-        for i in indices:
-            resultado = self.metadatos[i].copy()
-            resultado['score'] = float(similitudes[i])  # Añadir puntuación de similitud
+        for i, score in zip(indices, puntuaciones):
+            resultado = self.metadatos[i]
+            if permitidos is not None and "fuentes" in resultado:
+                fuente = next((f for f in resultado["fuentes"] if f.get("documento") in permitidos), None)
+                if fuente is not None:
+                    resultado.update(fuente)
+            resultado['score'] = float(score)  # Añadir puntuación de similitud
             resultados.append(resultado)
-            
         return resultados
 
-    def guardar(self, ruta: str = "vector_store.pkl") -> None:
+    def guardar(self, ruta: str = "vector_store", tam_bloque_textos: Optional[int] = None) -> None:
+        """
+        Guarda el almacén de vectores en un directorio con formato versionado:
+
+        - manifest.json: versión del formato, parámetros del almacén y
+          generación (subdirectorio gen-NNNNNN) con los datos vigentes
+        - gen-NNNNNN/: los datos de un guardado:
+        - embeddings.npy: matriz (n, dim) ya normalizada, en el dtype del almacén
+        - codigos.npy: códigos comprimidos (solo si el almacén está comprimido)
+        - metadatos.npz: columnas de los metadatos (ids de documento, chunk_id,
+          span y posición de cada texto en textos.bin)
+        - documentos.json: tabla de nombres de documento y campos extra
+        - textos.bin: textos de los chunks (los que comparten texto, como los
+          spans de un documento, lo comparten también aquí), por bloques zlib
+          si tam_bloque_textos > 0
+        - indices.pkl: índices IVF/HNSW/BM25, centroides de documentos y cuantizador (solo si existen)
+        - vivas.npy: máscara de filas no borradas (solo si hay borradas sin compactar)
+        - wal-NNNNNN.log: segmentos del log incremental (ver activar_wal),
+          junto al manifiesto
+
+        Las matrices se guardan en .npy planos para que cargar() pueda
+        abrirlas con mmap sin leerlas enteras. Cada guardado escribe sus datos
+        en una generación nueva y termina sustituyendo el manifiesto (un único
+        renombrado atómico) por uno que apunta a ella: una caída a mitad deja
+        el manifiesto anterior apuntando a datos intactos, y nunca se
+        sobrescriben archivos que un almacén cargado tenga abiertos o con mmap
+        (en Windows no se podría). Se conserva también la generación anterior,
+        para los procesos que la estén cargando; las más antiguas se borran.
+        Al cargar, los textos se quedan en disco y solo se leen los de los
+        resultados de cada búsqueda.
+
+        Si el almacén tiene el WAL activo sobre este mismo directorio, guardar
+        equivale a compactar_wal().
+        
+        Args:
+            ruta: Directorio donde guardar el almacén
+            tam_bloque_textos: Comprimir textos.bin con zlib en bloques de este tamaño (0 = sin comprimir)
+        """
+        if tam_bloque_textos is not None:
+            self.tam_bloque_textos = tam_bloque_textos
+        if self._wal is not None and os.path.abspath(ruta) == os.path.abspath(self._ruta_wal):
+            self.compactar_wal()
+            return
+        with self._cerrojo:
+            instantanea = self._instantanea()
+        # Los segmentos de log que hubiera en el directorio no corresponden a este almacén
+        previos = listar_segmentos(ruta) if os.path.isdir(ruta) else []
+        ultimo = previos[-1][0] if previos else 0
+        self._escribir_directorio(ruta, instantanea, segmento_wal=ultimo)
+        for _, segmento in previos:
+            os.remove(segmento)
+        self._en_disco = (os.path.abspath(ruta), instantanea["version"])
+
+    def _instantanea(self) -> Dict[str, Any]:
+        """
+        Estado consistente del almacén para escribirlo a disco. Debe tomarse
+        con el cerrojo: las matrices son vistas (las filas ya escritas no
+        cambian) y lo mutable se copia.
+        """
+        indices = None
+        if any(i is not None for i in (self.ivf, self.hnsw, self.cuantizador, self.bm25, self.centroides)):
+            indices = pickle.dumps({"ivf": self.ivf, "hnsw": self.hnsw, "cuantizador": self.cuantizador,
+                                    "bm25": self.bm25, "centroides": self.centroides})
+        return {
+            "n": self._n,
+            "embeddings": self.embeddings,
+            "codigos": self.codigos,
+            "metadatos": self.metadatos.vista(),
+            "indices": indices,
+            "originales": self.originales,
+            "reordenar": self.reordenar,
+            # Las marcas de borrado sí cambian en filas ya escritas: se copian
+            "vivas": self._vivas[:self._n].copy() if self._n_borradas else None,
+            "version": self.version,
+        }
+
+    def _escribir_directorio(self, ruta: str, instantanea: Dict[str, Any], segmento_wal: int) -> None:
+        """
+        Escribe una instantánea con el formato de guardar(): los datos en una
+        generación nueva y, al final, el manifiesto que la hace vigente.
+        """
+        os.makedirs(ruta, exist_ok=True)
+        anterior = self._generacion_vigente(ruta)
+        generaciones = self._generaciones(ruta)
+        numero = int(_GENERACION.match(generaciones[-1]).group(1)) + 1 if generaciones else 1
+        generacion = f"gen-{numero:06d}"
+        datos = os.path.join(ruta, generacion)
+        os.makedirs(datos)
+
+        with _escritura_atomica(os.path.join(datos, "embeddings.npy")) as f:
+            np.save(f, instantanea["embeddings"])
+        if instantanea["codigos"] is not None:
+            with _escritura_atomica(os.path.join(datos, "codigos.npy")) as f:
+                np.save(f, instantanea["codigos"])
+        columnas = instantanea["metadatos"].columnas()
+        with _escritura_atomica(os.path.join(datos, "textos.bin")) as f:
+            bloques = escribir_textos(f, columnas["trozos_texto"], self.tam_bloque_textos)
+        with _escritura_atomica(os.path.join(datos, "metadatos.npz")) as f:
+            np.savez(f, bloques=bloques if bloques is not None else np.zeros(0, dtype=np.int64),
+                     **{nombre[1:]: columnas[nombre[1:]] for nombre in MetadatosColumnares.COLUMNAS})
+        with _escritura_atomica(os.path.join(datos, "documentos.json")) as f:
+            f.write(json.dumps({
+                "tabla": columnas["tabla_documentos"],
+                "extras": sorted(columnas["extras"].items()),
+            }, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        if instantanea["indices"] is not None:
+            with _escritura_atomica(os.path.join(datos, "indices.pkl")) as f:
+                f.write(instantanea["indices"])
+        if instantanea["vivas"] is not None:
+            with _escritura_atomica(os.path.join(datos, "vivas.npy")) as f:
+                np.save(f, instantanea["vivas"])
+
+        # Único paso que cambia lo que ve cargar(): hasta aquí sigue vigente la generación anterior
+        with _escritura_atomica(os.path.join(ruta, MANIFIESTO)) as f:
+            f.write(json.dumps({
+                "version": FORMATO_VERSION,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "n": instantanea["n"],
+                "originales": instantanea["originales"],
+                "reordenar": instantanea["reordenar"],
+                "tam_bloque_textos": self.tam_bloque_textos,
+                "generacion": generacion,
+                "segmento_wal": segmento_wal  # Segmentos <= a este ya están incluidos
+            }).encode("utf-8"))
+        self._borrar_generaciones(ruta, conservar={generacion, anterior})
+
+    @staticmethod
+    def _generaciones(ruta: str) -> List[str]:
+        """Subdirectorios de generación de 'ruta', de la más antigua a la más nueva."""
+        return sorted(n for n in os.listdir(ruta) if _GENERACION.match(n))
+
+    @staticmethod
+    def _generacion_vigente(ruta: str) -> Optional[str]:
+        """Generación a la que apunta el manifiesto ('' si es del formato sin generaciones)."""
+        try:
+            with open(os.path.join(ruta, MANIFIESTO), "r", encoding="utf-8") as f:
+                return json.load(f).get("generacion", "")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @classmethod
+    def _borrar_generaciones(cls, ruta: str, conservar: set) -> None:
+        """
+        Borra las generaciones (y los datos del formato sin generaciones) que
+        no están en 'conservar', incluidas las que dejó a medias una caída. Si
+        algún archivo sigue en uso (en Windows no se puede borrar), se deja
+        para el siguiente guardado.
+        """
+        for generacion in cls._generaciones(ruta):
+            if generacion not in conservar:
+                try:
+                    shutil.rmtree(os.path.join(ruta, generacion))
+                except OSError:
+                    pass
+        if "" not in conservar:
+            for nombre in _ARCHIVOS_SIN_GENERACION:
+                try:
+                    os.remove(os.path.join(ruta, nombre))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    break  # En uso: se reintenta en el siguiente guardado
+
+    def activar_wal(self, ruta: str = "vector_store", umbral_compactacion: Optional[int] = None) -> None:
         """
-        Guarda el almacén de vectores en un archivo.
+        Activa la persistencia incremental: a partir de ahora cada agregar()
+        añade el lote a un log de solo-añadir en 'ruta' (con fsync) en lugar
+        de reescribir el almacén completo. Cuando el log supera el umbral se
+        compacta en segundo plano en los archivos principales.
+
+        Una caída a mitad de una escritura solo puede dejar un registro
+        incompleto al final del log, que cargar() descarta.
         
+        Si 'ruta' no es el directorio del que se cargó o en el que se guardó
+        el almacén, o este ha cambiado desde entonces, primero se guarda
+        entero ahí (sustituyendo lo que hubiera): el log solo tiene sentido
+        sobre un directorio con el mismo contenido que la memoria.
+
         Args:
-            ruta: Ruta del archivo donde guardar el almacén
+            ruta: Directorio del almacén (en el que se cargó o uno nuevo)
+            umbral_compactacion: Bytes de log pendientes que disparan la compactación
         """
-        with open(ruta, "wb") as f:
-            pickle.dump({
-                "embeddings": self.embeddings, 
-                "metadatos": self.metadatos, 
-                "dim": self.dim
-            }, f)
+        if self._en_disco != (os.path.abspath(ruta), self.version):
+            self.guardar(ruta)
+        if umbral_compactacion is not None:
+            self.umbral_compactacion = umbral_compactacion
+        self._wal = RegistroWAL(ruta, self.dim)
+        self._ruta_wal = ruta
+
+    def compactar_wal(self, en_segundo_plano: bool = False) -> None:
+        """
+        Incorpora el log a los archivos principales del almacén y borra los
+        segmentos ya incorporados. Las búsquedas no se bloquean y las
+        escrituras solo mientras se toma la instantánea.
+        
+        Args:
+            en_segundo_plano: Ejecutar la compactación en un hilo aparte
             
+        Raises:
+            ValueError: Si el WAL no está activo
+        """
+        if self._wal is None:
+            raise ValueError("El WAL no está activo; usa activar_wal()")
+        if en_segundo_plano:
+            if self._hilo_compactacion is None or not self._hilo_compactacion.is_alive():
+                self._hilo_compactacion = threading.Thread(target=self.compactar_wal, daemon=True)
+                self._hilo_compactacion.start()
+            return
+        with self._cerrojo_compactacion:
+            with self._cerrojo:
+                sellado = self._wal.sellar()
+                instantanea = self._instantanea()
+            self._escribir_directorio(self._ruta_wal, instantanea, segmento_wal=sellado)
+            self._wal.borrar_hasta(sellado)
+
+    def cerrar_wal(self) -> None:
+        """Espera a la compactación en curso (si la hay) y cierra el log."""
+        if self._hilo_compactacion is not None:
+            self._hilo_compactacion.join()
+        if self._wal is not None:
+            self._wal.cerrar()
+            self._wal = None
+            self._ruta_wal = None
+
     @classmethod
-    def cargar(cls, ruta: str = "vector_store.pkl") -> 'VectorStore':
+    def cargar(cls, ruta: str = "vector_store", mmap: bool = True) -> 'VectorStore':
         """
-        Carga un almacén de vectores desde un archivo.
+        Carga un almacén de vectores guardado con guardar().
+
+        Con mmap=True las matrices se abren con np.load(mmap_mode='r'): la
+        carga es casi instantánea, las páginas se leen bajo demanda desde la
+        caché del sistema y varios procesos comparten la misma memoria física.
+        Si luego se agregan vectores, la matriz se copia a memoria propia.
+
+        Los registros del log incremental (activar_wal) que aún no se habían
+        compactado se vuelven a aplicar. También acepta los archivos .pkl de
+        versiones anteriores.
         
         Args:
-            ruta: Ruta del archivo a cargar
+            ruta: Directorio (o archivo .pkl antiguo) a cargar
+            mmap: Abrir las matrices en modo memory-mapped
             
         Returns:
             Instancia de VectorStore cargada
             
         Raises:
             FileNotFoundError: Si el archivo no existe
-            pickle.UnpicklingError: Si hay un error al cargar el archivo
+            ValueError: Si hay un error al cargar el archivo o la versión no es compatible
         """
         try:
-            with open(ruta, "rb") as f:
-                datos = pickle.load(f)
-                
-            vs = cls(datos["dim"])
-            vs.embeddings = datos["embeddings"]
-            vs.metadatos = datos["metadatos"]
+            if not os.path.isdir(ruta):
+                return cls._cargar_pickle(ruta)
+
+            with open(os.path.join(ruta, MANIFIESTO), "r", encoding="utf-8") as f:
+                manifiesto = json.load(f)
+            if manifiesto["version"] > FORMATO_VERSION:
+                raise ValueError(f"Versión de formato {manifiesto['version']} no soportada")
+
+            modo = "r" if mmap else None
+            vs = cls(manifiesto["dim"], manifiesto.get("dtype", "float32"))
+            vs.tam_bloque_textos = manifiesto.get("tam_bloque_textos", 0)
+            ruta_wal = ruta
+            ruta = os.path.join(ruta, manifiesto.get("generacion", ""))  # Los logs siguen junto al manifiesto
+            vs.metadatos = cls._cargar_metadatos(ruta, manifiesto)
+            vs._n = manifiesto["n"]
+            vs.originales = manifiesto["originales"]
+            vs.reordenar = manifiesto["reordenar"]
+            if vs.originales:
+                vs._matriz = np.load(os.path.join(ruta, "embeddings.npy"), mmap_mode=modo)
+            ruta_indices = os.path.join(ruta, "indices.pkl")
+            if os.path.exists(ruta_indices):
+                with open(ruta_indices, "rb") as f:
+                    indices = pickle.load(f)
+                vs.ivf = indices["ivf"]
+                vs.hnsw = indices["hnsw"]
+                vs.cuantizador = indices["cuantizador"]
+                vs.bm25 = indices.get("bm25")
+                vs.centroides = indices.get("centroides")
+            if vs.cuantizador is not None:
+                vs._codigos = np.load(os.path.join(ruta, "codigos.npy"), mmap_mode=modo)
+            if len(vs.metadatos) != vs._n:
+                raise ValueError("El número de metadatos no coincide con el manifiesto")
+            ruta_vivas = os.path.join(ruta, "vivas.npy")
+            vs._vivas = np.load(ruta_vivas) if os.path.exists(ruta_vivas) else np.ones(vs._n, dtype=bool)
+            vs._n_borradas = int(vs._n - np.count_nonzero(vs._vivas))
+            vs._indexar_documentos(0, vs._documentos_filas())
+            for secuencia, segmento in listar_segmentos(ruta_wal):
+                if secuencia > manifiesto.get("segmento_wal", 0):
+                    for tipo, datos in leer_segmento(segmento, vs.dim):
+                        if tipo == ELIMINAR:
+                            for nombre in datos:
+                                vs.eliminar_documento(nombre)
+                        else:
+                            vs.agregar(*datos)
+            vs._en_disco = (os.path.abspath(ruta_wal), vs.version)
             return vs
             
         except FileNotFoundError as e:
-            raise FileNotFoundError(f"No se encontró el archivo {ruta}") from e
+            raise FileNotFoundError(f"No se encontró el archivo {e.filename or ruta}") from e
         except Exception as e:
             raise ValueError(f"Error al cargar el archivo {ruta}: {str(e)}") from e
-            embs = np.array(self.embeddings).astype('float32')
-            faiss.normalize_L2(embs)
-            self.index.add(embs)
+
+    @staticmethod
+    def _cargar_metadatos(ruta: str, manifiesto: Dict[str, Any]) -> MetadatosColumnares:
+        """Lee los metadatos de un directorio; los textos se quedan en textos.bin."""
+        if manifiesto["version"] < 2:
+            with open(os.path.join(ruta, "metadatos.json"), "r", encoding="utf-8") as f:
+                return MetadatosColumnares.desde_lista(json.load(f))
+        with np.load(os.path.join(ruta, "metadatos.npz")) as columnas:
+            columnas = dict(columnas)
+        with open(os.path.join(ruta, "documentos.json"), "r", encoding="utf-8") as f:
+            documentos = json.load(f)
+        tam_bloque = manifiesto.get("tam_bloque_textos", 0)
+        textos = TextosEnDisco(os.path.join(ruta, "textos.bin"), tam_bloque,
+                               columnas["bloques"] if tam_bloque else None)
+        if manifiesto["version"] < 3:
+            # La versión 2 guardaba los textos seguidos, sin spans
+            desplazamientos = columnas.pop("desplazamientos")
+            columnas["inicios"] = desplazamientos[:-1]
+            columnas["longitudes"] = np.diff(desplazamientos)
+            columnas["span_inicios"] = columnas["span_fines"] = np.zeros(len(columnas["doc_ids"]), dtype=np.int32)
+        return MetadatosColumnares.desde_columnas(
+            documentos["tabla"], columnas, {fila: extra for fila, extra in documentos["extras"]}, textos)
+
+    @classmethod
+    def _cargar_pickle(cls, ruta: str) -> 'VectorStore':
+        """Carga el formato pickle de versiones anteriores (listas de listas sin normalizar)."""
+        with open(ruta, "rb") as f:
+            datos = pickle.load(f)
+
+        vs = cls(datos["dim"])
+        embs = np.asarray(datos["embeddings"], dtype=np.float32).reshape(-1, vs.dim)
+        vs.agregar(embs, datos["metadatos"])
+        return vs
+
+    def publicar(self, nombre: Optional[str] = None) -> str:
+        """
+        Copia el almacén a un bloque de memoria compartida para que otros
+        procesos del mismo equipo lo usen con adjuntar() sin cargar su propia
+        copia: la memoria no crece con el número de procesos. El bloque es una
+        instantánea; lo que se agregue después no se ve en los procesos
+        adjuntados hasta volver a publicar. Se libera con dejar_de_publicar().
+        
+        Args:
+            nombre: Nombre del bloque (sin valor, lo elige el sistema)
+            
+        Returns:
+            Nombre del bloque, que se pasa a adjuntar() en los otros procesos
+            
+        Raises:
+            ValueError: Si el almacén no conserva los vectores originales
+        """
+        if not self.originales:
+            raise ValueError("Solo se pueden publicar almacenes que conservan los vectores originales")
+        with self._cerrojo:
+            bloque = memoria_compartida.publicar(
+                self.embeddings, self.metadatos, self._vivas[:self._n], self._rangos_documento, nombre)
+        self.dejar_de_publicar()
+        self._compartida = bloque
+        return bloque.name
+
+    def dejar_de_publicar(self) -> None:
+        """Libera el bloque publicado (los procesos adjuntados deben cerrarse antes)."""
+        if self._compartida is not None and not self.solo_lectura:
+            self._compartida.close()
+            self._compartida.unlink()
+            self._compartida = None
+
+    @classmethod
+    def adjuntar(cls, nombre: str, hilos: int = 1) -> 'VectorStore':
+        """
+        Abre en modo solo lectura un almacén publicado por otro proceso. La
+        matriz es una vista del bloque compartido y los metadatos se
+        decodifican solo para los resultados. Las búsquedas son exactas
+        (por bloques y con 'hilos' hilos): los índices IVF/HNSW no se publican.
+        
+        Args:
+            nombre: Nombre devuelto por publicar()
+            hilos: Hilos con los que se reparten los recorridos exactos
+            
+        Returns:
+            Instancia de VectorStore de solo lectura
+            
+        Raises:
+            FileNotFoundError: Si no existe un bloque con ese nombre
+        """
+        bloque, cabecera, embeddings, vivas, metadatos = memoria_compartida.adjuntar(nombre)
+        vs = cls(cabecera["dim"], cabecera["dtype"], hilos=hilos)
+        vs._compartida = bloque
+        vs.solo_lectura = True
+        vs._matriz = embeddings
+        vs._vivas = vivas
+        vs._n = len(embeddings)
+        vs._n_borradas = int(vs._n - np.count_nonzero(vivas))
+        vs.metadatos = metadatos
+        vs._rangos_documento = {doc: rangos for doc, rangos in cabecera["rangos"]}
+        return vs
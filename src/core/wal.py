@@ -0,0 +1,123 @@
+# src/core/wal.py
+import glob
+import json
+import os
+import re
+import struct
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+
+MAGIA = b"VSWL"
+CABECERA = struct.Struct("<4sII")  # magia, longitud del contenido, crc32 del contenido
+PATRON_SEGMENTO = re.compile(r"wal-(\d{6})\.log$")
+AGREGAR = b"A"   # Registro con un lote de vectores y metadatos
+ELIMINAR = b"E"  # Registro con documentos eliminados
+
+
+def ruta_segmento(directorio: str, secuencia: int) -> str:
+    return os.path.join(directorio, f"wal-{secuencia:06d}.log")
+
+
+def listar_segmentos(directorio: str) -> List[Tuple[int, str]]:
+    """Segmentos del log en el directorio como (secuencia, ruta), en orden."""
+    segmentos = []
+    for ruta in glob.glob(os.path.join(directorio, "wal-*.log")):
+        coincidencia = PATRON_SEGMENTO.search(ruta)
+        if coincidencia:
+            segmentos.append((int(coincidencia.group(1)), ruta))
+    return sorted(segmentos)
+
+
+def leer_segmento(ruta: str, dim: int) -> Iterator[Tuple[bytes, Union[Tuple[np.ndarray, List[Dict[str, Any]], Optional[Dict[str, str]]], List[str]]]]:
+    """
+    Recorre los registros completos de un segmento como (tipo, datos):
+    (AGREGAR, (embs, metas, textos)) o (ELIMINAR, documentos). Se detiene en el primer
+    registro truncado o con CRC incorrecto (una escritura interrumpida por
+    una caída), sin dar error: lo anterior a ese punto es válido.
+    """
+    with open(ruta, "rb") as f:
+        while True:
+            cabecera = f.read(CABECERA.size)
+            if len(cabecera) < CABECERA.size:
+                return
+            magia, longitud, crc = CABECERA.unpack(cabecera)
+            contenido = f.read(longitud)
+            if magia != MAGIA or len(contenido) < longitud or zlib.crc32(contenido) != crc:
+                return
+            tipo = contenido[:1]
+            if tipo == ELIMINAR:
+                yield tipo, json.loads(contenido[1:].decode("utf-8"))
+                continue
+            n, = struct.unpack_from("<I", contenido, 1)
+            tam_embs = n * dim * 4
+            embs = np.frombuffer(contenido, dtype=np.float32, count=n * dim, offset=5).reshape(n, dim)
+            metas = json.loads(contenido[5 + tam_embs:].decode("utf-8"))
+            textos = None
+            if isinstance(metas, dict):  # Lote con spans: {"metas": [...], "textos": {...}}
+                metas, textos = metas["metas"], metas["textos"]
+            yield tipo, (embs, metas, textos)
+
+
+class RegistroWAL:
+    """
+    Log de escritura anticipada (WAL) de un VectorStore, en segmentos de solo-añadir.
+
+    Cada llamada a escribir() añade un registro con los vectores y metadatos
+    de un lote y hace fsync, así que persistir un documento cuesta E/S
+    proporcional a ese documento. Los segmentos se numeran; al compactar se
+    "sella" el segmento activo y se abre uno nuevo, y los sellados se borran
+    una vez que su contenido está en los archivos principales del almacén.
+    """
+
+    def __init__(self, directorio: str, dim: int):
+        self.directorio = directorio
+        self.dim = dim
+        existentes = listar_segmentos(directorio)
+        # Siempre se empieza un segmento nuevo: nunca se escribe tras una posible cola rota
+        self.secuencia = (existentes[-1][0] if existentes else 0) + 1
+        self._archivo = open(ruta_segmento(directorio, self.secuencia), "ab")
+
+    def escribir(self, embs: np.ndarray, metas: List[Dict[str, Any]],
+                 textos: Optional[Dict[str, str]] = None) -> None:
+        """
+        Añade un registro con un lote (embeddings float32 normalizados) y lo
+        lleva a disco. 'textos' son los textos de documento de los chunks
+        dados como spans.
+        """
+        contenido = metas if textos is None else {"metas": metas, "textos": textos}
+        self._escribir_registro(AGREGAR
+                                + struct.pack("<I", len(embs))
+                                + np.ascontiguousarray(embs, dtype=np.float32).tobytes()
+                                + json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def escribir_eliminacion(self, documentos: List[str]) -> None:
+        """Añade un registro con documentos eliminados y lo lleva a disco."""
+        self._escribir_registro(ELIMINAR + json.dumps(documentos, ensure_ascii=False).encode("utf-8"))
+
+    def _escribir_registro(self, contenido: bytes) -> None:
+        self._archivo.write(CABECERA.pack(MAGIA, len(contenido), zlib.crc32(contenido)))
+        self._archivo.write(contenido)
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+
+    def sellar(self) -> int:
+        """Cierra el segmento activo, abre el siguiente y devuelve la secuencia del sellado."""
+        sellado = self.secuencia
+        self._archivo.close()
+        self.secuencia += 1
+        self._archivo = open(ruta_segmento(self.directorio, self.secuencia), "ab")
+        return sellado
+
+    def borrar_hasta(self, secuencia: int) -> None:
+        """Elimina los segmentos sellados ya incorporados a los archivos principales."""
+        for sec, ruta in listar_segmentos(self.directorio):
+            if sec <= secuencia:
+                os.remove(ruta)
+
+    def tamano_pendiente(self) -> int:
+        """Bytes en segmentos que aún no se han compactado."""
+        return sum(os.path.getsize(ruta) for _, ruta in listar_segmentos(self.directorio))
+
+    def cerrar(self) -> None:
+        self._archivo.close()
@@ -6,6 +6,18 @@ from src.agentes.agente_extraccion import AgenteExtraccion
 from src.agentes.agente_analisis import AgenteAnalisis
 from src.agentes.agente_respuesta import AgenteRespuesta
 
+def usar_analisis(analisis: AgenteAnalisis, configuracion: tuple = None):
+    """
+    Guarda el agente de la sesión, deteniendo la recarga de instantáneas del
+    anterior. 'configuracion' es la del botón de indexar con que se construyó
+    (None si se adjuntó o se cargó de una instantánea).
+    """
+    anterior = st.session_state.get("analisis")
+    if anterior is not None and anterior is not analisis and anterior.vigilante is not None:
+        anterior.vigilante.detener()
+    st.session_state["analisis"] = analisis
+    st.session_state["configuracion"] = configuracion
+
 # Configuración de la página
 st.set_page_config(page_title="🧠 Asistente de Apuntes", layout="wide")
 st.title("🧠 Asistente de Búsqueda de Apuntes")
@@ -34,6 +46,73 @@ with st.sidebar:
         help="Tamaño de los fragmentos en que se dividirán los documentos"
     )
     
+    # Configuración del índice de búsqueda
+    tipo_indice = st.selectbox(
+        "🗂️ Índice de búsqueda",
+        ["Exacto", "HNSW"],
+        help="HNSW usa un grafo aproximado: solo compensa con decenas de miles de chunks "
+             "(con menos, la búsqueda exacta es igual de rápida) y construirlo lleva unos "
+             "milisegundos por chunk"
+    )
+    ef_busqueda = 64
+    if tipo_indice == "HNSW":
+        ef_busqueda = st.slider(
+            "🎯 efSearch",
+            min_value=16,
+            max_value=512,
+            value=64,
+            step=16,
+            help="Candidatos explorados por consulta: más alto = más preciso pero más lento"
+        )
+    
+    deduplicar = st.checkbox(
+        "🧹 Colapsar chunks duplicados",
+        help="Guarda una sola vez el texto repetido entre apuntes (cabeceras, diapositivas...)"
+    )
+    top_documentos = st.number_input(
+        "📚 Documentos preseleccionados (0 = todos)",
+        min_value=0,
+        max_value=1000,
+        value=0,
+        help="Búsqueda en dos fases: se eligen primero los documentos más parecidos y solo se recorren sus fragmentos"
+    )
+    hibrido = st.checkbox(
+        "🔤 Búsqueda híbrida (vectores + BM25)",
+        help="Combina la similitud semántica con la coincidencia exacta de términos (nombres, códigos, fórmulas...)"
+    )
+
+    # Índice publicado en memoria compartida por otro proceso (run_app.py --publicar)
+    nombre_compartido = st.text_input(
+        "🔗 Índice compartido (opcional)",
+        help="Nombre dado a --publicar: se usa ese índice sin cargar otra copia en memoria"
+    )
+    if nombre_compartido and st.button("🔗 Adjuntar índice compartido", use_container_width=True):
+        try:
+            analisis = AgenteAnalisis()
+            analisis.adjuntar_indice(nombre_compartido)
+            usar_analisis(analisis)
+            st.success(f"✅ Índice adjuntado ({len(analisis.store)} chunks)")
+        except Exception as e:
+            st.error(f"❌ No se pudo adjuntar el índice: {str(e)}")
+
+    # Instantáneas versionadas: otro proceso (run_app.py --solo_construir) o esta
+    # misma app publica índices nuevos y las sesiones que los usan se recargan solas
+    dir_instantaneas = st.text_input(
+        "🗃️ Carpeta de instantáneas (opcional)",
+        help="Al indexar se publica ahí una instantánea nueva; las sesiones que la usan cambian a ella sin pararse"
+    )
+    if dir_instantaneas and st.button("📡 Usar la última instantánea", use_container_width=True):
+        try:
+            analisis = AgenteAnalisis(hibrido=hibrido, top_documentos=top_documentos or None)
+            if analisis.vigilar_instantaneas(dir_instantaneas) is None:
+                analisis.vigilante.detener()
+                st.warning(f"⚠️ No hay ninguna instantánea en {dir_instantaneas}")
+            else:
+                usar_analisis(analisis)
+                st.success(f"✅ Instantánea cargada ({len(analisis.store)} chunks); se recargará al publicarse otra")
+        except Exception as e:
+            st.error(f"❌ No se pudo cargar la instantánea: {str(e)}")
+
     # Botón para indexar
     if st.button("🔄 Indexar apuntes", use_container_width=True):
         if not api_key:
@@ -63,11 +142,28 @@ with st.sidebar:
                     for doc in docs:
                         st.write(f"  - {doc}")
                 
-                analisis = AgenteAnalisis()
-                analisis.indexar_chunks(chunks_meta)
-                st.session_state["analisis"] = analisis
-                st.session_state["chunks_meta"] = chunks_meta
-                st.success("✅ Indexado completado")
+                # Si ni los apuntes ni la configuración han cambiado, se reutiliza el
+                # índice de la sesión en lugar de volver a construirlo (el HNSW tarda)
+                configuracion = (tipo_indice, ef_busqueda, deduplicar, hibrido, top_documentos)
+                if (st.session_state.get("configuracion") == configuracion
+                        and st.session_state.get("chunks_meta") == chunks_meta):
+                    st.success("✅ Los apuntes no han cambiado: se mantiene el índice actual")
+                else:
+                    analisis = AgenteAnalisis(
+                        hnsw_m=16 if tipo_indice == "HNSW" else None,
+                        ef_busqueda=ef_busqueda,
+                        deduplicar=deduplicar,
+                        hibrido=hibrido,
+                        top_documentos=top_documentos or None
+                    )
+                    analisis.indexar_chunks(chunks_meta, extractor.textos)
+                    if deduplicar:
+                        st.write(f"🧹 Chunks duplicados colapsados: {analisis.duplicados}")
+                    if dir_instantaneas:
+                        st.write(f"🗃️ Instantánea publicada: {analisis.publicar_instantanea(dir_instantaneas)}")
+                    usar_analisis(analisis, configuracion)
+                    st.session_state["chunks_meta"] = chunks_meta
+                    st.success("✅ Indexado completado")
                 
             except Exception as e:
                 st.error(f"❌ Error al indexar: {str(e)}")
@@ -88,12 +184,46 @@ pregunta = st.text_input(
     help="Escribe tu pregunta sobre el contenido de los apuntes"
 )
 
+# Filtro por documento
+documentos = st.multiselect(
+    "📄 Buscar solo en estos documentos (opcional):",
+    st.session_state["analisis"].store.documentos(),
+    help="Si no eliges ninguno se busca en todos los apuntes"
+)
+
+# Contexto alrededor de cada fragmento
+expandir = st.slider(
+    "↔️ Chunks vecinos de contexto",
+    min_value=0,
+    max_value=3,
+    value=0,
+    help="Añade a cada fragmento los chunks de antes y de después para no cortar frases en los bordes"
+)
+
+# Diversificación de resultados (MMR)
+diversificar = st.checkbox(
+    "🔀 Diversificar fragmentos (MMR)",
+    help="Evita usar varios fragmentos vecinos casi iguales (los chunks se solapan)"
+)
+lambda_mmr = None
+if diversificar:
+    lambda_mmr = st.slider(
+        "⚖️ Relevancia frente a diversidad (λ)",
+        min_value=0.0,
+        max_value=1.0,
+        value=0.5,
+        step=0.05,
+        help="1 = solo relevancia; valores más bajos priorizan fragmentos distintos entre sí"
+    )
+
 # Botón de búsqueda
 if st.button("🔍 Buscar", type="primary") and pregunta:
     with st.spinner("🤔 Procesando tu pregunta..."):
         try:
             analisis = st.session_state.get("analisis")
-            fragmentos = analisis.buscar_similares(pregunta, top_k=4)
+            analisis.lambda_mmr = lambda_mmr
+            fragmentos = analisis.buscar_similares(pregunta, top_k=4, documentos=documentos or None,
+                                                   expandir=expandir)
             
             if not fragmentos:
                 st.warning("No se encontraron fragmentos relevantes")
@@ -117,6 +247,13 @@ if st.button("🔍 Buscar", type="primary") and pregunta:
         except Exception as e:
             st.error(f"❌ Error al buscar: {str(e)}")
 
+# Estado de la caché de búsquedas
+cache = st.session_state["analisis"].cache
+if cache is not None:
+    e = cache.estadisticas()
+    st.caption(f"🗄️ Caché de búsquedas: {e['aciertos']} aciertos, {e['fallos']} fallos "
+               f"({e['tasa_aciertos']:.0%}), {e['entradas']} entradas")
+
 # Footer
 st.markdown("---")
 st.caption("🧠 Asistente de Apuntes - Procesamiento de lenguaje natural con Gemini")
@@ -0,0 +1,109 @@
+# test_compactacion.py
+# Inyecta fallos a mitad de la compactación del WAL y comprueba que el
+# almacén se sigue pudiendo cargar con el contenido correcto.
+import numpy as np
+import pytest
+
+from src.core import vector_store as modulo
+from src.core.vector_store import VectorStore
+
+
+def _almacen(ruta):
+    rng = np.random.default_rng(0)
+    vs = VectorStore(8)
+    for documento in ("a", "b"):
+        metas = [{"documento": documento, "chunk_id": i, "texto": f"{documento}-{i}"} for i in range(20)]
+        vs.agregar(rng.normal(size=(20, 8)).astype(np.float32), metas)
+    vs.activar_wal(str(ruta))
+    vs.eliminar_documento("a")  # Supera umbral_borradas: compactar() renumera las filas en memoria
+    return vs
+
+
+def _contenido(vs):
+    vivas = np.flatnonzero(vs._vivas[:len(vs)])
+    return sorted((vs.metadatos[i]["documento"], vs.metadatos[i]["chunk_id"], vs.metadatos[i]["texto"])
+                  for i in vivas.tolist())
+
+
+@pytest.mark.parametrize("funcion", ["savez", "save"])
+def test_caida_durante_compactar_wal(tmp_path, monkeypatch, funcion):
+    vs = _almacen(tmp_path)
+    esperado = _contenido(vs)
+
+    def fallar(*args, **kwargs):
+        raise OSError("caída simulada")
+
+    monkeypatch.setattr(modulo.np, funcion, fallar)
+    with pytest.raises(OSError):
+        vs.compactar_wal()
+    monkeypatch.undo()
+
+    recargado = VectorStore.cargar(str(tmp_path))
+    assert _contenido(recargado) == esperado
+    assert recargado.buscar(np.ones(8, dtype=np.float32), 3)[0]["documento"] == "b"
+
+
+def test_compactar_wal_conserva_generaciones_en_uso(tmp_path):
+    vs = _almacen(tmp_path)
+    vs.compactar_wal()
+    abierto = VectorStore.cargar(str(tmp_path))  # Con mmap sobre la generación vigente
+    vs.agregar(np.ones((1, 8), dtype=np.float32), [{"documento": "c", "chunk_id": 0, "texto": "c-0"}])
+    vs.compactar_wal()
+
+    assert _contenido(abierto) == [("b", i, f"b-{i}") for i in range(20)]
+    assert ("c", 0, "c-0") in _contenido(VectorStore.cargar(str(tmp_path)))
+    vs.compactar_wal()
+    assert len(VectorStore._generaciones(str(tmp_path))) == 2  # Vigente y anterior
+
+
+def test_compactar_wal_sin_sobrescribir_archivos_en_uso(tmp_path, monkeypatch):
+    # En Windows no se puede renombrar sobre un archivo abierto o con mmap, ni borrarlo
+    vs = _almacen(tmp_path)
+    vs.compactar_wal()
+    abierto = VectorStore.cargar(str(tmp_path))
+    reemplazar = modulo.os.replace
+
+    def replace_como_windows(origen, destino):
+        if modulo.os.path.exists(destino) and not destino.endswith(modulo.MANIFIESTO):
+            raise PermissionError(destino)
+        reemplazar(origen, destino)
+
+    def rmtree_como_windows(ruta, *args, **kwargs):
+        raise PermissionError(ruta)
+
+    monkeypatch.setattr(modulo.os, "replace", replace_como_windows)
+    monkeypatch.setattr(modulo.shutil, "rmtree", rmtree_como_windows)
+    for _ in range(3):
+        vs.agregar(np.ones((1, 8), dtype=np.float32), [{"documento": "c", "chunk_id": 0, "texto": "c-0"}])
+        vs.compactar_wal()
+    monkeypatch.undo()
+
+    assert len(VectorStore.cargar(str(tmp_path))) == len(vs)
+    assert _contenido(abierto) == [("b", i, f"b-{i}") for i in range(20)]
+    vs.compactar_wal()  # Ya sin archivos en uso, se borran las generaciones pendientes
+    assert len(VectorStore._generaciones(str(tmp_path))) == 2
+
+
+def test_activar_wal_sobre_otro_almacen_lo_sustituye(tmp_path):
+    rng = np.random.default_rng(1)
+    viejo = VectorStore(8)
+    viejo.agregar(rng.normal(size=(50, 8)).astype(np.float32),
+                  [{"documento": "viejo", "chunk_id": i, "texto": f"v-{i}"} for i in range(50)])
+    viejo.guardar(str(tmp_path))
+
+    nuevo = VectorStore(8)
+    nuevo.agregar(rng.normal(size=(10, 8)).astype(np.float32),
+                  [{"documento": "nuevo", "chunk_id": i, "texto": f"n-{i}"} for i in range(10)])
+    nuevo.activar_wal(str(tmp_path))
+    nuevo.agregar(np.ones((1, 8), dtype=np.float32), [{"documento": "nuevo2", "chunk_id": 0, "texto": "n2"}])
+    nuevo.cerrar_wal()
+
+    recargado = VectorStore.cargar(str(tmp_path))
+    assert _contenido(recargado) == _contenido(nuevo)
+    assert "viejo" not in recargado.documentos()
+
+    # Sobre el directorio del que se cargó no se reescribe nada
+    generaciones = VectorStore._generaciones(str(tmp_path))
+    recargado.activar_wal(str(tmp_path))
+    assert VectorStore._generaciones(str(tmp_path)) == generaciones
+    recargado.cerrar_wal()